@@ -4,32 +4,52 @@ import json
 from tools import (
     MidasConfig,
     Pretension_Loads_df_to_json,
+    ptns_cable_rows,
     truss_force_tablejson_to_table,
     Pretension_Loads_json_to_df,
 )
+from history import ConvergenceHistory, estimate_jacobian
+from solver import (
+    group_bounds,
+    per_cable,
+    solve_constrained_tension,
+    symmetry_groups,
+)
+from workspace import RunWorkspace, atomic_path, midas_lock
+import numpy as np
 import os
 import re
+import shutil
+import tempfile
 
-# 创建MidasConfig实例
-midas_config = MidasConfig()
+# 创建MidasConfig实例，非Windows系统或未安装MIDAS时只能使用回放（见replay.py）
+try:
+    midas_config = MidasConfig()
+    # 使用配置信息
+    base_url = midas_config.base_url
+    api_key = midas_config.api_key
+except OSError:
+    base_url = api_key = None
 
-# 使用配置信息
-base_url = midas_config.base_url
-api_key = midas_config.api_key
+# MidasAPI使用的请求函数，为None时直接发送HTTP请求，见set_midas_transport
+_midas_transport = None
 
 
-def MidasAPI(method, command, body=None):
+def set_midas_transport(transport):
     """
-    发送HTTP请求到Midas API并返回响应的JSON数据。
-    参数:
-        method (str): HTTP请求方法，如"GET"或"POST"。
-        command (str): Midas API的命令路径。
-        body (dict, 可选): 请求体的JSON数据。默认为None。
-    返回:
-        dict: 响应的JSON数据。
-    示例:
-        response_json = MidasAPI("GET", "/db/STAG")
+    设置MidasAPI使用的请求函数，用于录制或回放MIDAS API通信（见replay.py）。
+    :param transport: 与send_midas_request参数相同的函数，为None时恢复直接发送HTTP请求。
+    """
+    global _midas_transport
+    _midas_transport = transport
+
+
+def send_midas_request(method, command, body=None):
+    """
+    直接发送HTTP请求到Midas API并返回响应的JSON数据，参数同MidasAPI。
     """
+    if base_url is None:
+        raise RuntimeError("未找到MIDAS连接信息，无法发送请求")
     # 使用从MidasConfig获取的base_url和api_key
     headers = {"Content-Type": "application/json", "MAPI-Key": api_key}
     url = base_url + command
@@ -44,171 +64,663 @@ def MidasAPI(method, command, body=None):
     return response.json()
 
 
-def delete_iteration_files():
+def MidasAPI(method, command, body=None):
     """
-    删除当前目录下所有以"迭代"开头并以".xlsx"结尾的文件。
-    这个函数遍历当前目录中的所有文件，检查每个文件名是否以"迭代"开头并以".xlsx"结尾。
+    发送HTTP请求到Midas API并返回响应的JSON数据。
+    参数:
+        method (str): HTTP请求方法，如"GET"或"POST"。
+        command (str): Midas API的命令路径。
+        body (dict, 可选): 请求体的JSON数据。默认为None。
+    返回:
+        dict: 响应的JSON数据。
+    示例:
+        response_json = MidasAPI("GET", "/db/STAG")
+    """
+    if _midas_transport is not None:
+        return _midas_transport(method, command, body)
+    return send_midas_request(method, command, body)
+
+
+def delete_iteration_files(folder="."):
+    """
+    删除指定目录（默认为当前目录）下所有以"迭代"开头并以".xlsx"结尾的文件。
+    这个函数遍历目录中的所有文件，检查每个文件名是否以"迭代"开头并以".xlsx"结尾。
     如果是，则删除该文件，并打印一条消息表示文件已被删除。
     """
-    for filename in os.listdir("."):
+    for filename in os.listdir(folder):
         # 检查文件名是否以"迭代"开头并以".xlsx"结尾
         if filename.startswith("迭代") and filename.endswith(".xlsx"):
             # 删除文件
-            os.remove(filename)
+            os.remove(os.path.join(folder, filename))
             # 打印一条消息表示文件已被删除
             print(f"Deleted file: {filename}")
 
 
-def compute_tension(tension: str, target: str, eps: float = 0.15):
+# 迭代中只需要单元号和I端轴力
+FORCE_COMPONENTS = ["Elem", "Force-I"]
+# 获取施工阶段步骤名称时只需要阶段和步骤
+STAGE_COMPONENTS = ["Elem", "Stage", "Step"]
+# 导出全部施工阶段的索力历程
+HISTORY_COMPONENTS = ["Elem", "Stage", "Step", "Force-I"]
+
+
+def build_truss_force_request(
+    export_path,
+    eles,
+    force_unit="N",
+    stage_step=None,
+    components=FORCE_COMPONENTS,
+    place=3,
+):
+    """
+    构造导出TrussForce结果表格的POST请求数据。
+    :param export_path: MIDAS导出表格的文件路径，为None时不导出文件，表格直接在响应中返回。
+    :param eles: 需要导出的单元号列表。
+    :param force_unit: 力的单位，默认为"N"。
+    :param stage_step: 施工阶段步骤名称，如"成桥:002(最后)"，为None时导出全部阶段。
+    :param components: 需要导出的列，默认只导出单元号和I端轴力。
+    :param place: 小数位数，默认为3位，索力以N为单位时已足够。
+    :return: 符合/POST/TABLE要求的请求数据。
+    """
+    argument = {
+        "TABLE_NAME": "TrussForce",
+        "TABLE_TYPE": "TRUSSFORCE",
+        "UNIT": {"FORCE": force_unit, "DIST": "m"},
+        "STYLES": {"FORMAT": "Fixed", "PLACE": place},
+        "COMPONENTS": list(components),
+        "NODE_ELEMS": {"KEYS": eles},
+        "LOAD_CASE_NAMES": ["合计(CS)"],
+        "OPT_CS": True,
+    }
+    if export_path is not None:
+        argument["EXPORT_PATH"] = export_path
+    if stage_step is not None:
+        argument["STAGE_STEP"] = [stage_step]
+    return {"Argument": argument}
+
+
+def read_stage_table(path):
+    """
+    读取阶段信息导出文件（GBK编码，可能包含无法解析的字符），并转换为DataFrame。
+    :param path: 导出文件路径。
+    :return: TrussForce表格的DataFrame。
+    """
+    with open(
+        path,
+        "r",
+        encoding="gbk",
+        errors="ignore",
+    ) as f:
+        temp_json = f.read()
+    extracted_string = re.search(r"(\"TrussForce\":+)(.+)}", temp_json).group(0)
+    temp_json = json.loads("{" + extracted_string)
+    return truss_force_tablejson_to_table(temp_json)
+
+
+def read_table_json(path):
+    """
+    读取导出的表格文件，返回未转换的JSON数据。
+    :param path: 导出文件路径。
+    :return: 表格JSON数据，如{"TrussForce": {"HEAD": [...], "DATA": [...]}}。
+    """
+    with open(
+        path,
+        "r",
+        encoding="utf-8-sig",
+        errors="replace",
+    ) as f:
+        return json.load(f)
+
+
+def read_force_table(path):
+    """
+    读取索力结果导出文件，并转换为DataFrame。
+    :param path: 导出文件路径。
+    :return: TrussForce表格的DataFrame。
+    """
+    return truss_force_tablejson_to_table(read_table_json(path))
+
+
+class TrussForceExporter:
+    """
+    TrussForce表格导出器，负责选择表格的获取方式。
+
+    mode为"response"时直接从/POST/TABLE的响应体中读取表格；为"file"时导出到临时目录中的
+    文件再读取；为"auto"时先尝试响应体，若响应中不含表格则自动改用文件并在之后保持该方式。
+    临时目录对每个导出器唯一，并发运行时不会互相覆盖导出文件，可通过temp_dir指定到内存盘。
+
+    示例:
+        exporter = TrussForceExporter()
+        df = exporter.export(MidasAPI, eles, stage_step="成桥:002(最后)")
+        exporter.close()
+    """
+
+    def __init__(self, mode="auto", temp_dir=None):
+        """
+        :param mode: 表格获取方式，"auto"、"response"或"file"。
+        :param temp_dir: 临时目录的父目录，默认为系统临时目录。
+        """
+        if mode not in ("auto", "response", "file"):
+            raise ValueError(f"未知的表格获取方式：{mode}")
+        self.mode = mode
+        self.folder = tempfile.mkdtemp(prefix="CalTensionForce_", dir=temp_dir)
+        self._count = 0
+
+    def prepare(
+        self, eles, force_unit="N", stage_step=None, components=FORCE_COMPONENTS
+    ):
+        """
+        构造导出请求，参数含义见build_truss_force_request。
+        :return: (请求数据, 导出文件路径)，直接读取响应体时导出文件路径为None。
+        """
+        if self.mode in ("auto", "response"):
+            path = None
+        else:
+            self._count += 1
+            path = os.path.join(self.folder, f"TrussForce{self._count:04d}.json")
+        body = build_truss_force_request(path, eles, force_unit, stage_step, components)
+        return body, path
+
+    def collect(
+        self,
+        response,
+        path,
+        reader=read_force_table,
+        parser=truss_force_tablejson_to_table,
+    ):
+        """
+        从响应体或导出文件中取得表格。
+        :param reader: 读取导出文件的函数。
+        :param parser: 转换响应体中表格JSON的函数，为None时直接返回JSON数据。
+        :return: reader或parser的结果；auto模式下响应中不含表格时返回None，需重新导出。
+        """
+        if path is None:
+            if isinstance(response, dict) and "TrussForce" in response:
+                self.mode = "response"
+                return parser(response) if parser else response
+            if self.mode == "response":
+                raise ValueError("MIDAS响应中不包含TrussForce表格")
+            # 响应中不含表格，改为导出文件
+            self.mode = "file"
+            return None
+        try:
+            return reader(path)
+        finally:
+            os.remove(path)
+
+    def export(
+        self,
+        midas,
+        eles,
+        force_unit="N",
+        stage_step=None,
+        reader=read_force_table,
+        components=FORCE_COMPONENTS,
+        parser=truss_force_tablejson_to_table,
+    ):
+        """
+        使用同步的midas函数（如MidasAPI）导出表格并返回DataFrame。
+        """
+        while True:
+            body, path = self.prepare(eles, force_unit, stage_step, components)
+            response = midas("POST", "/POST/TABLE", body)
+            df = self.collect(response, path, reader, parser)
+            if df is not None:
+                return df
+
+    def close(self):
+        """
+        删除临时目录。
+        """
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def export_force_history(midas, eles, exporter=None, force_unit="N"):
+    """
+    导出指定单元在全部施工阶段和步骤下的索力历程，供postprocess.compute_envelopes使用。
+    :param midas: 同步的midas函数，如MidasAPI。
+    :param eles: 需要导出的单元号列表。
+    :param exporter: TrussForceExporter实例，为None时临时创建。
+    :param force_unit: 力的单位，默认为"N"。
+    :return: 未转换的表格JSON数据。
+    """
+    own_exporter = exporter is None
+    if own_exporter:
+        exporter = TrussForceExporter()
+    try:
+        return exporter.export(
+            midas,
+            eles,
+            force_unit=force_unit,
+            reader=read_table_json,
+            components=HISTORY_COMPONENTS,
+            parser=None,
+        )
+    finally:
+        if own_exporter:
+            exporter.close()
+
+
+def format_stage_step(allstage, stage_table):
+    """
+    由施工阶段信息和阶段信息表格得到最后一个施工阶段的最后一个步骤名称，
+    find_stage_step与async_api.find_stage_step_async共用。
+    :param allstage: GET /db/STAG的响应数据。
+    :param stage_table: 以STAGE_COMPONENTS导出的TrussForce表格DataFrame。
+    :return: 施工阶段步骤名称，如"成桥:002(最后)"。
+    """
+    # 获取最后一个阶段的名称
+    stagename = list(allstage["STAG"].items())[-1][-1]["NAME"]
+    # 获取最后的step
+    step_name = stage_table["Step"].iloc[-3]
+    # 格式化阶段步骤名称
+    return f"{stagename}:{step_name}"
+
+
+def find_stage_step(exporter, ele):
+    """
+    获取最后一个施工阶段的最后一个步骤名称，需在分析完成后调用。
+    :param exporter: TrussForceExporter实例。
+    :param ele: 用于查询的任一单元号。
+    :return: 施工阶段步骤名称，如"成桥:002(最后)"。
+    """
+    # 获取所有阶段的信息
+    allstage = MidasAPI("GET", "/db/STAG", {})
+    stage_table = exporter.export(
+        MidasAPI,
+        [ele],
+        reader=read_stage_table,
+        components=STAGE_COMPONENTS,
+    )
+    return format_stage_step(allstage, stage_table)
+
+
+def element_forces(temp_value, eles):
+    """
+    按单元号从导出表格中取出各单元的I端轴力，不依赖表格的行顺序。
+    :param temp_value: 本次分析导出的TrussForce表格DataFrame，需包含Elem和Force-I列。
+    :param eles: 单元号列表。
+    :return: 与eles顺序一致的float64数组，以N为单位。
+    :raise ValueError: 表格中单元号重复或缺少某些单元时。
+    """
+    force = temp_value.set_index("Elem")["Force-I"]
+    if not force.index.is_unique:
+        raise ValueError("导出的TrussForce表格中单元号重复")
+    force = force.reindex(eles)
+    missing = force.index[force.isna()].tolist()
+    if missing:
+        raise ValueError(f"导出的TrussForce表格中缺少单元{missing}")
+    return force.to_numpy(dtype=np.float64)
+
+
+def update_deviation(target_tension, tension_value, temp_value):
+    """
+    根据本次分析结果更新目标索力DataFrame中的施工索力、正装成桥索力、偏差和偏差百分比列。
+    各列均以N为单位、float64类型计算，输入已经是float64时不做复制。
+    :param target_tension: 目标索力DataFrame，会被原地修改。
+    :param tension_value: 本次迭代使用的施工索力DataFrame。
+    :param temp_value: 本次分析导出的TrussForce表格DataFrame，按Elem列与单元号对应。
+    :return: 更新后的目标索力DataFrame。
+    """
+    target = target_tension["张力"].to_numpy(dtype=np.float64)
+    force = element_forces(temp_value, target_tension["单元号"].to_numpy())
+    deviation = force - target
+    target_tension["施工索力"] = tension_value["张力"].to_numpy(dtype=np.float64)
+    target_tension["正装成桥索力"] = force
+    target_tension["偏差"] = deviation
+    target_tension["偏差百分比"] = 100.0 * deviation / target
+    return target_tension
+
+
+def read_target_tension(target, lcname=None):
+    """
+    读取目标索力JSON文件，每个单元只保留参与索力迭代的一个荷载项（见ptns_cable_rows）。
+    :param target: 目标索力数据的JSON文件路径。
+    :param lcname: 荷载工况名称，为None时取各单元的第一个荷载项。
+    :return: 每个单元一行的目标索力DataFrame。
+    """
+    with open(target, "r", encoding="utf-8") as f:
+        target_items = Pretension_Loads_json_to_df(json.load(f))
+    rows = ptns_cable_rows(target_items, lcname=lcname)
+    return target_items.iloc[rows].reset_index(drop=True)
+
+
+def set_cable_tension(tension_items, rows, values):
+    """
+    修改参与索力迭代的荷载项的张力，并返回PUT /db/PTNS的请求数据。
+    单元的其他荷载项原样保留在请求数据中，不会被MIDAS删除。
+    :param tension_items: ptns_json_to_table得到的全部荷载项，会被原地修改。
+    :param rows: ptns_cable_rows返回的行位置。
+    :param values: 与rows对应的张力，以N为单位。
+    :return: 预张力荷载JSON数据。
+    """
+    tension_items.iloc[rows, tension_items.columns.get_loc("张力")] = values
+    return Pretension_Loads_df_to_json(tension_items)
+
+
+def compute_tension(
+    tension: str,
+    target: str,
+    eps: float = 0.15,
+    table_mode: str = "auto",
+    temp_dir: str = None,
+    history: str = None,
+    work_dir: str = None,
+    on_iteration=None,
+    lcname: str = None,
+    lock_timeout: float = None,
+):
     """
     计算并调整索力，直到偏差百分比满足要求。
+
+    计算期间持有与MIDAS API地址对应的进程间锁，同一模型的计算任务依次执行。
+    取得锁之后才清理工作目录、创建收敛历史和临时导出目录，等待锁的任务不会影响正在计算的任务。
+
     :param tension: 包含索力数据的JSON文件路径。
     :param target: 目标索力数据的JSON文件路径。
     :param eps: 允许的最大偏差百分比，默认为0.15。
+    :param table_mode: 结果表格的获取方式，见TrussForceExporter，默认为"auto"。
+    :param temp_dir: 导出文件临时目录的父目录，可指定为内存盘。
+    :param history: 收敛历史的保存路径（不含扩展名），见ConvergenceHistory，为None时不保存。
+    :param work_dir: 保存各次迭代结果"迭代NN.xlsx"的目录，为None时新建一个workspace.RunWorkspace，
+        结果的attrs["work_dir"]记录实际使用的目录。
+    :param on_iteration: 可选的回调函数on_iteration(n, df)，每次迭代后调用，用于界面实时显示结果。
+    :param lcname: 单元包含多个预张力荷载项时，参与迭代的荷载工况名称；为None时取第一个荷载项，
+        其余荷载项保持不变。
+    :param lock_timeout: 等待模型锁的最长时间（秒），超时抛出TimeoutError；为None时一直等待。
     """
-    # 删除运行目录里名称为迭代+数字的xlsx文件
-    delete_iteration_files()
+    # 未指定工作目录时新建，与其他计算任务互不干扰
+    if work_dir is None:
+        work_dir = RunWorkspace().folder
 
-    # 读取目标JSON文件
-    with open(target, "r", encoding="utf-8") as f:
-        target_json = json.load(f)
-    # 将目标JSON文件转换为DataFrame
-    target_tension = Pretension_Loads_json_to_df(target_json)
+    # 读取目标JSON文件，并转换为每个单元一行的DataFrame
+    target_tension = read_target_tension(target, lcname)
     # 将单元号转换为整数并转换为列表
     eles = target_tension["单元号"].astype(int)
     eles = eles.tolist()
 
-    # 获取当前文件夹的路径
-    current_folder = os.getcwd()
-
-    # 获取所有阶段的信息
-    allstage = MidasAPI("GET", "/db/STAG", {})
-    # 获取最后一个阶段的信息
-    last_step_information = list(allstage["STAG"].items())[-1]
-    # 获取最后一个阶段的名称
-    stagename = last_step_information[-1]["NAME"]
-
     # 读取索力JSON文件
     with open(tension, "r", encoding="utf-8") as f:
         tension_json = json.load(f)
+    # 全部荷载项及各单元参与迭代的荷载项所在的行
+    tension_items = Pretension_Loads_json_to_df(tension_json)
+    rows = ptns_cable_rows(tension_items, eles, lcname)
 
     # 初始化迭代次数
     n = 0
 
+    # 模型锁，避免其他任务同时修改同一模型
+    lock = midas_lock(base_url, lock_timeout)
+    exporter = None
+
     # 开始迭代，直到偏差百分比满足要求或达到最大迭代次数
-    while True:
-        n += 1
-
-        # 如果迭代次数超过20次，跳出循环
-        if n > 20:
-            break
-        # 发送PUT请求更新索力数据
-        MidasAPI("PUT", "/db/PTNS", tension_json)
-        # 发送POST请求进行分析
-        MidasAPI("POST", "/doc/Anal", {})
-        if n == 1:
-            # 获取最后的step
-            POST_json = {
-                "Argument": {
-                    "TABLE_NAME": "TrussForce",
-                    "TABLE_TYPE": "TRUSSFORCE",
-                    "EXPORT_PATH": f"{current_folder}\\Output2.json",
-                    "UNIT": {"FORCE": "kN", "DIST": "m"},
-                    "STYLES": {"FORMAT": "Fixed", "PLACE": 12},
-                    "COMPONENTS": [
-                        "Elem",
-                        "Load",
-                        "Stage",
-                        "Step",
-                        "Force-I",
-                        "Force-J",
-                    ],
-                    "NODE_ELEMS": {"KEYS": [eles[0]]},
-                    "LOAD_CASE_NAMES": ["合计(CS)"],
-                    "OPT_CS": True,
-                }
-            }
-            MidasAPI("POST", "/POST/TABLE", POST_json)
-            with open(
-                "Output2.json",
-                "r",
-                encoding="gbk",
-                errors="ignore",
-            ) as f:
-                temp_json2 = f.read()
-            extracted_string = re.search(r"(\"TrussForce\":+)(.+)}", temp_json2).group(
-                0
+    try:
+        lock.acquire()
+        # 删除工作目录里名称为迭代+数字的xlsx文件
+        delete_iteration_files(work_dir)
+        # 创建结果表格导出器
+        exporter = TrussForceExporter(table_mode, temp_dir)
+        # 创建收敛历史文件
+        if history is not None:
+            history = ConvergenceHistory.create(history, eles)
+
+        while True:
+            n += 1
+
+            # 如果迭代次数超过20次，跳出循环
+            if n > 20:
+                break
+            # 发送PUT请求更新索力数据
+            MidasAPI("PUT", "/db/PTNS", tension_json)
+            # 发送POST请求进行分析
+            MidasAPI("POST", "/doc/Anal", {})
+            if n == 1:
+                # 获取最后一个施工阶段的最后一个步骤
+                STAGE_STEP = find_stage_step(exporter, eles[0])
+
+            # 导出表格数据，并转换为DataFrame
+            temp_value = exporter.export(MidasAPI, eles, stage_step=STAGE_STEP)
+
+            # 本次迭代各单元的施工索力
+            tension_value = tension_items.iloc[rows]
+
+            # 更新目标索力DataFrame中的施工索力、正装成桥索力、偏差和偏差百分比列
+            update_deviation(target_tension, tension_value, temp_value)
+
+            # 将目标索力DataFrame保存为Excel文件，写入完成后再替换，避免读到不完整的文件
+            with atomic_path(os.path.join(work_dir, f"迭代{n:02d}.xlsx")) as tmp:
+                target_tension.to_excel(tmp, index=False)
+            # 记录收敛历史
+            if history is not None:
+                history.append(target_tension)
+            # 通知界面本次迭代的结果
+            if on_iteration:
+                on_iteration(n, target_tension)
+
+            # 如果偏差百分比的绝对值均小于0.15%，结束循环
+            if abs(target_tension["偏差百分比"]).max() < eps:
+                break
+
+            # 更新索力JSON文件中的张力数据
+            tension_json = set_cable_tension(
+                tension_items,
+                rows,
+                tension_value["张力"].to_numpy() - target_tension["偏差"].to_numpy(),
             )
-            temp_json2 = json.loads("{" + extracted_string)
-            temp_value2 = truss_force_tablejson_to_table(temp_json2)
-            step_name = temp_value2["Step"].iloc[-3]
-
-            # 格式化阶段步骤名称
-            STAGE_STEP = f"{stagename}:{step_name}"
-
-            # 定义POST请求的JSON数据
-            POST_json = {
-                "Argument": {
-                    "TABLE_NAME": "TrussForce",
-                    "TABLE_TYPE": "TRUSSFORCE",
-                    "EXPORT_PATH": f"{current_folder}\\Output.json",
-                    "UNIT": {"FORCE": "N", "DIST": "m"},
-                    "STYLES": {"FORMAT": "Fixed", "PLACE": 12},
-                    "COMPONENTS": [
-                        "Elem",
-                        "Load",
-                        "Stage",
-                        "Step",
-                        "Force-I",
-                        "Force-J",
-                    ],
-                    "NODE_ELEMS": {"KEYS": eles},
-                    "LOAD_CASE_NAMES": ["合计(CS)"],
-                    "OPT_CS": True,
-                    "STAGE_STEP": [STAGE_STEP],
-                }
-            }
-
-        # 发送POST请求导出表格数据
-        MidasAPI("POST", "/POST/TABLE", POST_json)
-
-        # 读取导出的JSON文件
-        with open(
-            f"{current_folder}\\Output.json",
-            "r",
-            encoding="utf-8-sig",
-            errors="replace",
-        ) as f:
-            temp_json = json.load(f)
-
-        # 将导出的JSON文件转换为表格数据
-        temp_value = truss_force_tablejson_to_table(temp_json)
-
-        # 将索力JSON文件转换为DataFrame
-        tension_value = Pretension_Loads_json_to_df(tension_json)
-
-        # 更新目标索力DataFrame中的施工索力、正装成桥索力、偏差和偏差百分比列
-        target_tension["施工索力"] = tension_value["张力"].astype(float)
-        target_tension["正装成桥索力"] = temp_value["Force-I"].astype(float)
-        target_tension["偏差"] = target_tension["正装成桥索力"].astype(
-            float
-        ) - target_tension["张力"].astype(float)
-        target_tension["偏差百分比"] = (
-            100.0
-            * target_tension["偏差"].astype(float)
-            / target_tension["张力"].astype(float)
-        )
+    finally:
+        # 删除临时导出文件，释放模型锁
+        if exporter is not None:
+            exporter.close()
+        lock.release()
+    target_tension.attrs["work_dir"] = work_dir
+    return target_tension
 
-        # 将目标索力DataFrame保存为Excel文件
-        target_tension.to_excel(f"迭代{n:02d}.xlsx", index=False)
 
-        # 如果偏差百分比的绝对值均小于0.15%，结束循环
-        if abs(target_tension["偏差百分比"]).max() < eps:
-            break
+def compute_tension_subset(
+    result,
+    cables,
+    eps: float = 0.15,
+    max_iterations: int = 20,
+    history: str = None,
+    table_mode: str = "auto",
+    temp_dir: str = None,
+    lcname: str = None,
+    lock_timeout: float = None,
+):
+    """
+    只对指定的索重新迭代施工索力，其余索保持模型中当前的施工索力不变。
+
+    与compute_tension的固定点迭代不同，这里使用索力响应矩阵J做耦合更新
+    （施工索力 -= J⁻¹ × 偏差），并在每次迭代后按Broyden方法修正J，
+    适用于diagnose_cables找出的少数振荡或耦合较强的索。
+    每次迭代只更新和导出这些索，请求数据量与索数成正比；这些索的其他预张力荷载项从模型中读取并原样保留。
+
+    :param result: compute_tension返回的DataFrame，模型中的施工索力应与其"施工索力"列一致。
+    :param cables: 需要重新迭代的单元号列表。
+    :param eps: 允许的最大偏差百分比，默认为0.15。
+    :param max_iterations: 最大迭代次数。
+    :param history: compute_tension保存的收敛历史路径，提供时用于估计J的初值，否则以单位矩阵为初值。
+    :param table_mode: 结果表格的获取方式，见TrussForceExporter，默认为"auto"。
+    :param temp_dir: 导出文件临时目录的父目录，可指定为内存盘。
+    :param lcname: 参与迭代的荷载工况名称，应与compute_tension一致。
+    :param lock_timeout: 等待模型锁的最长时间（秒），超时抛出TimeoutError；为None时一直等待。
+    :return: 只包含指定索的结果DataFrame，列与compute_tension的结果相同。
+    """
+    cables = [int(ele) for ele in cables]
+    subset = result[result["单元号"].astype(int).isin(cables)].reset_index(drop=True)
+    eles = subset["单元号"].astype(int).tolist()
+    target = subset["张力"].to_numpy(dtype=float)
+
+    # 索力响应矩阵的初值
+    if history is not None:
+        jacobian = estimate_jacobian(ConvergenceHistory.open(history), eles)
+    else:
+        jacobian = np.eye(len(eles))
+
+    exporter = None
+    last_tension = last_force = None
+    lock = midas_lock(base_url, lock_timeout)
+    try:
+        lock.acquire()
+        exporter = TrussForceExporter(table_mode, temp_dir)
+        # 从模型中读取指定索的全部荷载项，PUT时其他荷载项原样保留
+        tension_items = Pretension_Loads_json_to_df(MidasAPI("GET", "/db/PTNS"))
+        tension_items = tension_items[tension_items["单元号"].isin(eles)]
+        tension_items = tension_items.reset_index(drop=True)
+        rows = ptns_cable_rows(tension_items, eles, lcname)
+        tension_json = set_cable_tension(
+            tension_items, rows, subset["施工索力"].to_numpy(dtype=float)
+        )
+        for n in range(1, max_iterations + 1):
+            # 只更新指定索的施工索力并分析
+            MidasAPI("PUT", "/db/PTNS", tension_json)
+            MidasAPI("POST", "/doc/Anal", {})
+            if n == 1:
+                STAGE_STEP = find_stage_step(exporter, eles[0])
+            temp_value = exporter.export(MidasAPI, eles, stage_step=STAGE_STEP)
+            tension_value = tension_items.iloc[rows]
+            update_deviation(subset, tension_value, temp_value)
+
+            if abs(subset["偏差百分比"]).max() < eps:
+                break
+
+            tension = tension_value["张力"].to_numpy(dtype=float)
+            force = subset["正装成桥索力"].to_numpy(dtype=float)
+            # Broyden秩一修正：使J满足最近一次的施工索力变化与索力变化
+            if last_tension is not None:
+                dt = tension - last_tension
+                df = force - last_force
+                if dt @ dt > 0:
+                    jacobian += np.outer(df - jacobian @ dt, dt) / (dt @ dt)
+            last_tension, last_force = tension, force
+
+            # 耦合更新施工索力
+            tension_json = set_cable_tension(
+                tension_items, rows, tension - np.linalg.solve(jacobian, force - target)
+            )
+    finally:
+        if exporter is not None:
+            exporter.close()
+        lock.release()
+    return subset
+
+
+def compute_tension_constrained(
+    tension: str,
+    target: str,
+    lower=None,
+    upper=None,
+    weights=None,
+    symmetric: bool = True,
+    eps: float = 0.15,
+    perturbation: float = 0.01,
+    max_verifications: int = 3,
+    table_mode: str = "auto",
+    temp_dir: str = None,
+    lcname: str = None,
+    lock_timeout: float = None,
+):
+    """
+    在施工索力约束下求解施工索力，使成桥索力与目标索力的加权偏差平方和最小。
 
-        # 更新索力JSON文件中的张力数据
-        tension_value["张力"] = tension_value["张力"] - target_tension["偏差"]
-        tension_json = Pretension_Loads_df_to_json(tension_value)
+    同一组名称的索视为对称索，施工索力相等。先以初始施工索力分析一次，再逐组增加
+    perturbation比例的施工索力各分析一次，得到索力对各组施工索力的线性响应，
+    然后求解有界最小二乘问题；之后每次校核分析都以新的结果为线性化点重新求解，
+    直到偏差百分比满足要求、约束下无法再改进或达到max_verifications次。
+    所需分析次数为 组数 + 1 + 校核次数，与固定点迭代相比不会超出约束。
+
+    :param tension: 包含初始施工索力的JSON文件路径。
+    :param target: 目标索力数据的JSON文件路径。
+    :param lower: 施工索力下限，标量、{单元号: 值}字典或None（无下限）。
+    :param upper: 施工索力上限（如千斤顶能力），标量、{单元号: 值}字典或None（无上限）。
+    :param weights: 各索偏差的权重，标量、{单元号: 值}字典或None（均为1）。
+    :param symmetric: 是否按组名称施加对称约束。
+    :param eps: 允许的最大偏差百分比，默认为0.15。
+    :param perturbation: 计算线性响应时施工索力的相对增量。
+    :param max_verifications: 最多校核分析次数，至少为1，使模型中的施工索力与返回结果一致。
+    :param table_mode: 结果表格的获取方式，见TrussForceExporter，默认为"auto"。
+    :param temp_dir: 导出文件临时目录的父目录，可指定为内存盘。
+    :param lcname: 参与求解的荷载工况名称，见compute_tension。
+    :param lock_timeout: 等待模型锁的最长时间（秒），超时抛出TimeoutError；为None时一直等待。
+    :return: 与compute_tension结果列相同的DataFrame。
+    """
+    if max_verifications < 1:
+        raise ValueError(
+            "max_verifications至少为1，否则模型会停留在最后一次扰动分析的状态"
+        )
+    target_tension = read_target_tension(target, lcname)
+    with open(tension, "r", encoding="utf-8") as f:
+        tension_items = Pretension_Loads_json_to_df(json.load(f))
+    eles = target_tension["单元号"].astype(int).tolist()
+    rows = ptns_cable_rows(tension_items, eles, lcname)
+    target_force = target_tension["张力"].to_numpy(dtype=float)
+
+    # 对称组和约束
+    _, G = symmetry_groups(target_tension["组名称"], symmetric)
+    lb, ub = group_bounds(
+        G, per_cable(lower, eles, -np.inf), per_cable(upper, eles, np.inf)
+    )
+    w = per_cable(weights, eles, 1.0)
+    # 组施工索力取组内初始施工索力的平均值
+    x = (G.T @ tension_items["张力"].to_numpy(dtype=float)[rows]) / G.sum(axis=0)
+    x = np.clip(x, lb, ub)
+
+    exporter = None
+    lock = midas_lock(base_url, lock_timeout)
+    STAGE_STEP = None
+
+    def analyze(x):
+        """按组施工索力x分析并返回各索的成桥索力。"""
+        nonlocal STAGE_STEP
+        MidasAPI("PUT", "/db/PTNS", set_cable_tension(tension_items, rows, G @ x))
+        MidasAPI("POST", "/doc/Anal", {})
+        if STAGE_STEP is None:
+            STAGE_STEP = find_stage_step(exporter, eles[0])
+        temp_value = exporter.export(MidasAPI, eles, stage_step=STAGE_STEP)
+        return element_forces(temp_value, eles), temp_value
+
+    try:
+        lock.acquire()
+        exporter = TrussForceExporter(table_mode, temp_dir)
+        force, temp_value = analyze(x)
+        update_deviation(target_tension, tension_items.iloc[rows], temp_value)
+
+        if abs(target_tension["偏差百分比"]).max() >= eps:
+            # 逐组计算索力对组施工索力的线性响应
+            response = np.empty(G.shape)
+            for k in range(G.shape[1]):
+                # 上下限相等的组施工索力固定，不需要计算响应
+                if lb[k] >= ub[k]:
+                    response[:, k] = 0.0
+                    continue
+                # 扰动后的施工索力须在上下限之内：优先向上扰动，空间不足时改为向下，
+                # 两侧都不足时取空间较大的一侧并截断到边界
+                h = perturbation * max(abs(x[k]), 1.0)
+                up, down = ub[k] - x[k], x[k] - lb[k]
+                if up < h:
+                    h = -h if down >= h else (up if up >= down else -down)
+                dx = np.zeros_like(x)
+                dx[k] = h
+                response[:, k] = (analyze(x + dx)[0] - force) / h
+
+            # 求解并校核；第一次必须校核，使模型中的施工索力恢复为求解结果
+            verified = False
+            for _ in range(max_verifications):
+                x_new = solve_constrained_tension(
+                    response, force, x, target_force, lb, ub, w
+                )
+                if verified and np.allclose(x_new, x, rtol=1e-6, atol=0.0):
+                    break
+                x = x_new
+                force, temp_value = analyze(x)
+                verified = True
+                update_deviation(target_tension, tension_items.iloc[rows], temp_value)
+                if abs(target_tension["偏差百分比"]).max() < eps:
+                    break
+    finally:
+        if exporter is not None:
+            exporter.close()
+        lock.release()
     return target_tension
 
 
@@ -0,0 +1,346 @@
+import asyncio
+import inspect
+import json
+import os
+
+import httpx
+
+from api import (
+    base_url as default_base_url,
+    api_key as default_api_key,
+    FORCE_COMPONENTS,
+    STAGE_COMPONENTS,
+    TrussForceExporter,
+    delete_iteration_files,
+    format_stage_step,
+    read_target_tension,
+    set_cable_tension,
+    read_force_table,
+    read_stage_table,
+    update_deviation,
+)
+from history import ConvergenceHistory
+from tools import Pretension_Loads_json_to_df, ptns_cable_rows
+from workspace import RunWorkspace, atomic_path, midas_lock
+
+
+class AsyncMidasAPI:
+    """
+    基于asyncio的Midas API客户端，与MidasAPI函数的调用方式一致。
+
+    多个客户端可以共享同一个httpx.AsyncClient，从而在一个进程中同时驱动多个模型，
+    无需为每个模型单独创建线程。
+
+    示例:
+        async with AsyncMidasAPI() as midas:
+            response_json = await midas("GET", "/db/STAG")
+    """
+
+    def __init__(self, base_url=None, api_key=None, client=None, timeout=None):
+        """
+        :param base_url: MIDAS API的基本URL，默认使用注册表中的配置。
+        :param api_key: MIDAS API密钥，默认使用注册表中的配置。
+        :param client: 共享的httpx.AsyncClient，为None时自动创建并在关闭时释放。
+        :param timeout: 请求超时时间（秒），为None时不限制，分析请求可能耗时较长。
+        """
+        self.base_url = base_url or default_base_url
+        self.api_key = api_key or default_api_key
+        self._own_client = client is None
+        self.client = client or httpx.AsyncClient(timeout=timeout)
+
+    async def __call__(self, method, command, body=None):
+        """
+        发送HTTP请求到Midas API并返回响应的JSON数据。
+        参数:
+            method (str): HTTP请求方法，如"GET"或"POST"。
+            command (str): Midas API的命令路径。
+            body (dict, 可选): 请求体的JSON数据。默认为None。
+        返回:
+            dict: 响应的JSON数据。
+        """
+        headers = {"Content-Type": "application/json", "MAPI-Key": self.api_key}
+        url = self.base_url + command
+
+        response = await self.client.request(
+            method=method, url=url, headers=headers, json=body
+        )
+
+        # 打印请求的方法、命令和响应的状态码
+        print(method, command, response.status_code)
+
+        return response.json()
+
+    async def aclose(self):
+        """
+        关闭客户端，仅释放由本实例创建的httpx.AsyncClient。
+        """
+        if self._own_client:
+            await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+
+async def _notify(callback, n, df):
+    """
+    调用迭代回调函数，兼容普通函数与协程函数。
+    """
+    result = callback(n, df)
+    if inspect.isawaitable(result):
+        await result
+
+
+def _save_excel(df, path):
+    """
+    将迭代结果原子地保存为Excel文件。
+    """
+    with atomic_path(path) as tmp:
+        df.to_excel(tmp, index=False)
+
+
+def _prepare_run(tension, target, work_dir, table_mode, history, lcname):
+    """
+    计算开始前的文件操作：清理工作目录、读取输入文件、创建收敛历史和导出器，在线程中执行。
+    导出器最后创建，前面的步骤出错时不会残留临时目录。
+    :return: (目标索力DataFrame, 单元号列表, 索力JSON数据, 全部荷载项, 参与迭代的行位置,
+        收敛历史或None, 导出器)。
+    """
+    # 删除工作目录里名称为迭代+数字的xlsx文件
+    delete_iteration_files(work_dir)
+
+    target_tension = read_target_tension(target, lcname)
+    eles = target_tension["单元号"].astype(int).tolist()
+
+    with open(tension, "r", encoding="utf-8") as f:
+        tension_json = json.load(f)
+    tension_items = Pretension_Loads_json_to_df(tension_json)
+    rows = ptns_cable_rows(tension_items, eles, lcname)
+
+    if history is not None:
+        history = ConvergenceHistory.create(history, eles)
+    exporter = TrussForceExporter(table_mode, work_dir)
+    return target_tension, eles, tension_json, tension_items, rows, history, exporter
+
+
+async def acquire_lock_async(lock):
+    """
+    异步获取workspace.FileLock，等待期间不占用线程，取消时不会在之后取得锁。
+    超过lock.timeout时抛出TimeoutError。
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    while not lock.try_acquire():
+        if lock.timeout is not None and loop.time() - start > lock.timeout:
+            raise TimeoutError(f"等待锁文件{lock.path}超时，模型正在被其他计算任务使用")
+        await asyncio.sleep(lock.poll_interval)
+
+
+async def export_table_async(
+    midas,
+    exporter,
+    eles,
+    force_unit="N",
+    stage_step=None,
+    reader=read_force_table,
+    components=FORCE_COMPONENTS,
+):
+    """
+    TrussForceExporter.export的异步版本，导出文件的读取在线程池中进行。
+    """
+    while True:
+        body, path = exporter.prepare(eles, force_unit, stage_step, components)
+        response = await midas("POST", "/POST/TABLE", body)
+        df = await asyncio.to_thread(exporter.collect, response, path, reader)
+        if df is not None:
+            return df
+
+
+async def find_stage_step_async(midas, exporter, ele):
+    """
+    api.find_stage_step的异步版本，需在分析完成后调用。
+    :param midas: AsyncMidasAPI实例。
+    :param exporter: TrussForceExporter实例。
+    :param ele: 用于查询的任一单元号。
+    :return: 施工阶段步骤名称，如"成桥:002(最后)"。
+    """
+    allstage = await midas("GET", "/db/STAG", {})
+    stage_table = await export_table_async(
+        midas,
+        exporter,
+        [ele],
+        reader=read_stage_table,
+        components=STAGE_COMPONENTS,
+    )
+    return format_stage_step(allstage, stage_table)
+
+
+async def compute_tension_async(
+    tension: str,
+    target: str,
+    eps: float = 0.15,
+    midas: AsyncMidasAPI = None,
+    work_dir: str = None,
+    on_iteration=None,
+    table_mode: str = "auto",
+    history: str = None,
+    lcname: str = None,
+    lock_timeout: float = None,
+):
+    """
+    compute_tension的异步版本，迭代逻辑与之相同，同样在计算期间持有模型锁。
+
+    每次迭代的Excel保存和on_iteration回调在后台执行，与下一次迭代的PUT和分析请求重叠；
+    输入文件的读取、工作目录的清理和导出文件的读取解析都放在线程池中进行，不阻塞事件循环。
+
+    :param tension: 包含索力数据的JSON文件路径。
+    :param target: 目标索力数据的JSON文件路径。
+    :param eps: 允许的最大偏差百分比，默认为0.15。
+    :param midas: AsyncMidasAPI实例，为None时使用默认配置创建。
+    :param work_dir: 迭代结果的保存目录，同时作为临时导出目录的父目录，
+        为None时新建一个workspace.RunWorkspace，结果的attrs["work_dir"]记录实际使用的目录。
+    :param on_iteration: 可选的回调函数on_iteration(n, df)，可以是协程函数，
+        df为本次迭代结果的副本。
+    :param table_mode: 结果表格的获取方式，见TrussForceExporter，默认为"auto"。
+    :param history: 收敛历史的保存路径（不含扩展名），见ConvergenceHistory，为None时不保存。
+    :param lcname: 参与迭代的荷载工况名称，见compute_tension。
+    :param lock_timeout: 等待模型锁的最长时间（秒），超时抛出TimeoutError；为None时一直等待。
+    """
+    own_midas = midas is None
+    if own_midas:
+        midas = AsyncMidasAPI()
+    # 未指定工作目录时新建，与其他计算任务互不干扰
+    if work_dir is None:
+        work_dir = (await asyncio.to_thread(RunWorkspace)).folder
+    # 后台任务：Excel保存和UI回调
+    pending = []
+    exporter = None
+    lock = midas_lock(midas.base_url, lock_timeout)
+
+    try:
+        # 异步等待模型锁，不阻塞事件循环，也不占用线程池
+        await acquire_lock_async(lock)
+        # 取得锁之后再清理工作目录、读取输入文件和创建临时导出目录
+        (
+            target_tension,
+            eles,
+            tension_json,
+            tension_items,
+            rows,
+            history,
+            exporter,
+        ) = await asyncio.to_thread(
+            _prepare_run, tension, target, work_dir, table_mode, history, lcname
+        )
+
+        history_task = None
+        n = 0
+        while True:
+            n += 1
+
+            # 如果迭代次数超过20次，跳出循环
+            if n > 20:
+                break
+            await midas("PUT", "/db/PTNS", tension_json)
+            await midas("POST", "/doc/Anal", {})
+            if n == 1:
+                # 获取最后一个施工阶段的最后一个步骤
+                STAGE_STEP = await find_stage_step_async(midas, exporter, eles[0])
+
+            temp_value = await export_table_async(
+                midas, exporter, eles, stage_step=STAGE_STEP
+            )
+
+            tension_value = tension_items.iloc[rows]
+            update_deviation(target_tension, tension_value, temp_value)
+
+            # 保存和回调使用快照，避免与下一次迭代的修改冲突
+            snapshot = target_tension.copy()
+            pending.append(
+                asyncio.create_task(
+                    asyncio.to_thread(
+                        _save_excel,
+                        snapshot,
+                        os.path.join(work_dir, f"迭代{n:02d}.xlsx"),
+                    )
+                )
+            )
+            if history is not None:
+                # 收敛历史需按迭代顺序追加，上一次追加完成后再在线程中追加
+                if history_task is not None:
+                    await history_task
+                history_task = asyncio.create_task(
+                    asyncio.to_thread(history.append, snapshot)
+                )
+                pending.append(history_task)
+            if on_iteration:
+                pending.append(asyncio.create_task(_notify(on_iteration, n, snapshot)))
+
+            # 如果偏差百分比的绝对值均小于eps，结束循环
+            if abs(target_tension["偏差百分比"]).max() < eps:
+                break
+
+            tension_json = set_cable_tension(
+                tension_items,
+                rows,
+                tension_value["张力"].to_numpy() - target_tension["偏差"].to_numpy(),
+            )
+
+        # 等待所有后台任务完成
+        await asyncio.gather(*pending)
+    finally:
+        for task in pending:
+            task.cancel()
+        if exporter is not None:
+            await asyncio.to_thread(exporter.close)
+        lock.release()
+        if own_midas:
+            await midas.aclose()
+    target_tension.attrs["work_dir"] = work_dir
+    return target_tension
+
+
+async def compute_tension_batch(jobs, eps: float = 0.15, timeout=None):
+    """
+    在一个进程中并发计算多个模型的施工索力，所有模型共享一个HTTP连接池。
+
+    MIDAS API地址相同的任务驱动的是同一个模型，按jobs中的顺序依次计算；
+    不同地址的任务并发计算。未指定base_url的任务使用默认地址。
+
+    :param jobs: 任务列表，每个任务为字典，包含以下键：
+        - tension: 索力JSON文件路径
+        - target: 目标索力JSON文件路径
+        - work_dir: 该模型的工作目录，各任务必须不同
+        - base_url, api_key: 可选，该模型对应的MIDAS API地址和密钥
+        - lcname: 可选，参与迭代的荷载工况名称
+    :param eps: 允许的最大偏差百分比，默认为0.15。
+    :param timeout: 请求超时时间（秒），为None时不限制。
+    :return: 与jobs顺序一致的结果DataFrame列表。
+    """
+    # 按MIDAS API地址分组
+    groups = {}
+    for i, job in enumerate(jobs):
+        groups.setdefault(job.get("base_url") or default_base_url, []).append(i)
+    results = [None] * len(jobs)
+
+    async with httpx.AsyncClient(timeout=timeout) as client:
+
+        async def run_group(indices):
+            # 同一模型的任务依次计算
+            for i in indices:
+                job = jobs[i]
+                results[i] = await compute_tension_async(
+                    job["tension"],
+                    job["target"],
+                    eps,
+                    midas=AsyncMidasAPI(
+                        job.get("base_url"), job.get("api_key"), client=client
+                    ),
+                    work_dir=job["work_dir"],
+                    lcname=job.get("lcname"),
+                )
+
+        await asyncio.gather(*(run_group(indices) for indices in groups.values()))
+    return results
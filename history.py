@@ -0,0 +1,205 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from workspace import write_json_atomic
+
+# 每次迭代为每根索记录的量，对应compute_tension结果中的列，单位为N
+HISTORY_FIELDS = ("施工索力", "正装成桥索力", "偏差")
+
+
+class ConvergenceHistory:
+    """
+    以内存映射数组保存的迭代收敛历史，形状为 迭代次数 × 索数 × HISTORY_FIELDS。
+
+    数据保存在"<path>.npy"中，单元号和已完成的迭代次数保存在"<path>.json"中。
+    读取时只映射文件，按需访问某根索或某次迭代的数据，不需要整体载入内存。
+    默认以float32保存以减少占用（索力约1e6 N时精度约0.1 N），读取出的数据按float64计算。
+
+    示例:
+        history = ConvergenceHistory.create("history", eles)
+        history.append(target_tension)
+        ...
+        history = ConvergenceHistory.open("history")
+        curve = history.cable(2001)
+    """
+
+    def __init__(self, path, data, elements, iterations):
+        self.path = path
+        self.data = data
+        self.elements = list(elements)
+        self.iterations = iterations
+        self._index = {ele: i for i, ele in enumerate(self.elements)}
+
+    @classmethod
+    def create(cls, path, elements, max_iterations=20, dtype=np.float32):
+        """
+        创建新的收敛历史文件，已有文件会被覆盖。
+        :param path: 文件路径（不含扩展名）。
+        :param elements: 单元号列表，顺序与compute_tension结果的行顺序一致。
+        :param max_iterations: 最大迭代次数。
+        :param dtype: 保存数据的类型，默认为float32。
+        """
+        elements = [int(ele) for ele in elements]
+        data = np.lib.format.open_memmap(
+            f"{path}.npy",
+            mode="w+",
+            dtype=dtype,
+            shape=(max_iterations, len(elements), len(HISTORY_FIELDS)),
+        )
+        history = cls(path, data, elements, 0)
+        history._write_meta()
+        return history
+
+    @classmethod
+    def open(cls, path, mode="r"):
+        """
+        打开已有的收敛历史文件。
+        :param path: 文件路径（不含扩展名）。
+        :param mode: 内存映射模式，"r"为只读，"r+"为可追加。
+        """
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        data = np.load(f"{path}.npy", mmap_mode=mode)
+        return cls(path, data, meta["elements"], meta["iterations"])
+
+    def _write_meta(self):
+        # 原子写入，读取方不会看到写了一半的元数据
+        write_json_atomic(
+            f"{self.path}.json",
+            {"elements": self.elements, "iterations": self.iterations, "unit": "N"},
+        )
+
+    def append(self, target_tension):
+        """
+        追加一次迭代的结果。
+        :param target_tension: compute_tension中的目标索力DataFrame，需包含HISTORY_FIELDS中的列。
+        """
+        if self.iterations >= self.data.shape[0]:
+            raise ValueError("迭代次数超过收敛历史文件的容量")
+        self.data[self.iterations] = target_tension[list(HISTORY_FIELDS)].to_numpy()
+        self.data.flush()
+        self.iterations += 1
+        self._write_meta()
+
+    def cable(self, ele):
+        """
+        返回一根索的迭代历史（float64），形状为 迭代次数 × HISTORY_FIELDS。
+        :param ele: 单元号。
+        """
+        return np.asarray(
+            self.data[: self.iterations, self._index[int(ele)], :], dtype=np.float64
+        )
+
+    def deviation_percent(self, ele):
+        """
+        返回一根索各次迭代的偏差百分比。
+        :param ele: 单元号。
+        """
+        curve = self.cable(ele)
+        return 100.0 * curve[:, 2] / (curve[:, 1] - curve[:, 2])
+
+    def max_deviation_percent(self):
+        """
+        返回各次迭代中所有索偏差百分比绝对值的最大值。
+        """
+        max_dev = np.empty(self.iterations)
+        # 逐次迭代计算，每次只访问一个迭代的数据
+        for n in range(self.iterations):
+            force = np.asarray(self.data[n, :, 1], dtype=np.float64)
+            deviation = np.asarray(self.data[n, :, 2], dtype=np.float64)
+            max_dev[n] = np.abs(100.0 * deviation / (force - deviation)).max()
+        return max_dev
+
+
+def diagnose_cables(history, eps=0.15, window=5):
+    """
+    根据收敛历史诊断导致不收敛的索，并按问题严重程度排序。
+
+    各列含义：
+        - 偏差百分比: 最后一次迭代的偏差百分比
+        - 收敛比: 最近window次迭代中，相邻两次偏差绝对值之比的几何平均，不小于1表示不收敛或振荡
+        - 符号变化次数: 偏差正负号变化的次数，次数多表示在目标值两侧振荡
+        - 自身响应系数: 索力变化对自身施工索力变化的回归系数，固定点迭代假设其为1
+        - 耦合强度: 索力变化中不能由自身施工索力变化解释的比例，越大表示受其他索影响越强
+        - 未收敛: 最后一次迭代的偏差百分比绝对值不小于eps
+
+    :param history: ConvergenceHistory对象。
+    :param eps: 允许的最大偏差百分比，默认为0.15。
+    :param window: 计算收敛比时使用的迭代次数。
+    :return: 诊断结果DataFrame，未收敛的索在前，按收敛比和偏差百分比降序排列。
+    """
+    n = history.iterations
+    if n == 0:
+        raise ValueError("收敛历史中没有迭代数据")
+    data = np.asarray(history.data[:n], dtype=np.float64)
+    tension, force, deviation = data[..., 0], data[..., 1], data[..., 2]
+    deviation_percent = 100.0 * deviation / (force - deviation)
+
+    # 收敛比
+    k = min(window, n - 1)
+    abs_dev = np.abs(deviation) + np.finfo(float).tiny
+    if k > 0:
+        ratio = np.exp(np.log(abs_dev[-k:] / abs_dev[-k - 1 : -1]).mean(axis=0))
+    else:
+        ratio = np.full(len(history.elements), np.nan)
+
+    # 偏差符号变化次数
+    sign_changes = (np.diff(np.sign(deviation), axis=0) != 0).sum(axis=0)
+
+    # 索力变化对施工索力变化的回归
+    dt = np.diff(tension, axis=0)
+    df = np.diff(force, axis=0)
+    dt2 = (dt * dt).sum(axis=0)
+    self_gain = np.divide(
+        (df * dt).sum(axis=0), dt2, out=np.full(dt2.shape, np.nan), where=dt2 > 0
+    )
+    df_norm = np.linalg.norm(df, axis=0)
+    residual = np.linalg.norm(df - np.nan_to_num(self_gain) * dt, axis=0)
+    coupling = np.divide(
+        residual, df_norm, out=np.full(df_norm.shape, np.nan), where=df_norm > 0
+    )
+
+    result = pd.DataFrame(
+        {
+            "单元号": history.elements,
+            "偏差百分比": deviation_percent[-1],
+            "收敛比": ratio,
+            "符号变化次数": sign_changes,
+            "自身响应系数": self_gain,
+            "耦合强度": coupling,
+            "未收敛": np.abs(deviation_percent[-1]) >= eps,
+        }
+    )
+    result["_偏差绝对值"] = result["偏差百分比"].abs()
+    result = result.sort_values(
+        ["未收敛", "收敛比", "_偏差绝对值"], ascending=False, na_position="last"
+    )
+    return result.drop(columns="_偏差绝对值").reset_index(drop=True)
+
+
+def estimate_jacobian(history, elements, ridge=1.0):
+    """
+    由收敛历史估计指定索之间的索力响应矩阵J（索力变化 ≈ J × 施工索力变化）。
+
+    迭代次数通常少于索数，因此以单位矩阵（即固定点迭代的假设）为先验做岭回归。
+
+    :param history: ConvergenceHistory对象。
+    :param elements: 单元号列表。
+    :param ridge: 向单位矩阵收缩的权重，相对于施工索力变化的平方和。
+    :return: 形状为 len(elements) × len(elements) 的矩阵。
+    """
+    index = [history._index[int(ele)] for ele in elements]
+    m = len(index)
+    n = history.iterations
+    if n < 2:
+        return np.eye(m)
+    tension = np.asarray(history.data[:n, index, 0], dtype=np.float64)
+    force = np.asarray(history.data[:n, index, 1], dtype=np.float64)
+    dt = np.diff(tension, axis=0)
+    df = np.diff(force, axis=0)
+    lam = ridge * max((dt * dt).sum() / m, np.finfo(float).tiny)
+    # 求解 min ||df - dt J^T||^2 + lam ||J - I||^2
+    jt = np.linalg.solve(dt.T @ dt + lam * np.eye(m), dt.T @ df + lam * np.eye(m))
+    return jt.T
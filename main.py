@@ -2,11 +2,18 @@ import flet as ft
 import pandas as pd
 import json
 from api import MidasAPI, compute_tension
+from history import ConvergenceHistory
 from tools import (
     Pretension_Loads_df_to_json,
+    ConvergenceChart,
     EditableDataFrame,
     Pretension_Loads_json_to_excel,
+    read_ptns_table,
 )
+from workspace import RunWorkspace, atomic_path
+
+# 等待模型锁的最长时间（秒），同一模型正在被其他计算任务使用时超时提示，避免界面一直无响应
+LOCK_TIMEOUT = 10
 
 
 def main(page: ft.Page):
@@ -23,38 +30,72 @@ def main(page: ft.Page):
         }
     )
 
+    def result_table(df):
+        """
+        将compute_tension的结果整理为界面显示的表格
+        """
+        return pd.DataFrame(
+            {
+                "单元号": df["单元号"],
+                "目标索力": df["张力"],
+                "实际索力": df["正装成桥索力"].round(4),
+                "偏差": df["偏差"].round(4),
+                "偏差百分比": df["偏差百分比"].round(4),
+            }
+        )
+
+    def show_iteration(n, df):
+        """
+        计算过程中显示每次迭代的结果，表格只更新发生变化的单元格
+        """
+        message_text.value = (
+            f"第{n}次迭代，最大偏差百分比：{abs(df['偏差百分比']).max():.4f}%"
+        )
+        message_text.update()
+        data_frame.patch_data(result_table(df))
+
+    def show_lock_busy():
+        """
+        等待模型锁超时时提示用户，同一模型同时只能由一个计算任务驱动
+        """
+        message_text.value = "模型正在被其他计算任务使用，请等待其完成后再开始计算"
+        page.update()
+
     def handle_close_xlsx(e):
         """
         处理关闭选择xlsx文件的对话框事件
         """
         global df  # 声明df为全局变量
         page.close(dlg_modal)  # 关闭对话框
-        df = pd.read_excel("init_tension.xlsx")  # 从xlsx文件中读取数据并更新df
+        df = read_ptns_table("init_tension.xlsx")  # 从xlsx文件中读取数据并更新df
+        workspace = RunWorkspace()  # 创建本次计算的工作目录，避免与其他计算任务冲突
         # 将DataFrame转换为JSON并保存为target.json和tension.json
         target_json = Pretension_Loads_df_to_json(df)  # 将DataFrame转换为JSON格式
-        with open("target.json", "w") as f:  # 打开target.json文件
+        with open(workspace.path("target.json"), "w") as f:  # 打开target.json文件
             json.dump(target_json, f)  # 将JSON数据写入文件
-        with open("tension.json", "w") as f:  # 打开tension.json文件
+        with open(workspace.path("tension.json"), "w") as f:  # 打开tension.json文件
             json.dump(target_json, f)  # 将JSON数据写入文件
 
         # 调用compute_tension函数进行迭代计算
-        df = compute_tension(
-            "tension.json", "target.json", float(error_tolerance_input.value)
-        )  # 调用compute_tension函数进行迭代计算
-
-        df = pd.DataFrame(
-            {
-                "单元号": df["单元号"],
-                "目标索力": df["张力"],
-                "实际索力": df["正装成桥索力"].round(4),
-                "偏差": df["偏差"].round(4),
-                "偏差百分比": df["偏差百分比"].round(4),
-            }
-        )
+        try:
+            df = compute_tension(
+                workspace.path("tension.json"),
+                workspace.path("target.json"),
+                float(error_tolerance_input.value),
+                history=workspace.path("history"),
+                work_dir=workspace.folder,
+                on_iteration=show_iteration,
+                lock_timeout=LOCK_TIMEOUT,
+            )  # 调用compute_tension函数进行迭代计算，并记录收敛历史
+        except TimeoutError:
+            show_lock_busy()  # 模型正在被其他计算任务使用
+            return
 
-        # 显示成功信息
+        # 显示成功信息，表格已在每次迭代后更新，保留最后一次迭代的高亮
         message_text.value = "索力计算完成！"  # 更新提示信息
-        data_frame.update_data(df)  # 更新数据框
+        convergence_chart.load(
+            ConvergenceHistory.open(workspace.path("history"))
+        )  # 显示收敛曲线
         page.update()  # 更新页面
 
     def handle_close_ui(e):
@@ -65,30 +106,32 @@ def main(page: ft.Page):
         page.close(dlg_modal)
         # 获取当前显示的数据
         df = data_frame.df
+        workspace = RunWorkspace()
         # 将DataFrame转换为JSON并保存为target.json和tension.json
         target_json = Pretension_Loads_df_to_json(df)
-        with open("target.json", "w") as f:
+        with open(workspace.path("target.json"), "w") as f:
             json.dump(target_json, f)
-        with open("tension.json", "w") as f:
+        with open(workspace.path("tension.json"), "w") as f:
             json.dump(target_json, f)
 
         # 调用compute_tension函数进行迭代计算
-        df = compute_tension(
-            "tension.json", "target.json", float(error_tolerance_input.value)
-        )
-        df = pd.DataFrame(
-            {
-                "单元号": df["单元号"],
-                "目标索力": df["张力"],
-                "实际索力": df["正装成桥索力"].round(4),
-                "偏差": df["偏差"].round(4),
-                "偏差百分比": df["偏差百分比"].round(4),
-            }
-        )
+        try:
+            df = compute_tension(
+                workspace.path("tension.json"),
+                workspace.path("target.json"),
+                float(error_tolerance_input.value),
+                history=workspace.path("history"),
+                work_dir=workspace.folder,
+                on_iteration=show_iteration,
+                lock_timeout=LOCK_TIMEOUT,
+            )
+        except TimeoutError:
+            show_lock_busy()
+            return
 
-        # 显示成功信息
+        # 显示成功信息，表格已在每次迭代后更新
         message_text.value = "索力计算完成！"
-        data_frame.update_data(df)
+        convergence_chart.load(ConvergenceHistory.open(workspace.path("history")))
         page.update()
 
     page.vertical_alignment = ft.MainAxisAlignment.CENTER
@@ -196,6 +239,9 @@ def main(page: ft.Page):
     # 创建一个可编辑的数据表
     data_frame = EditableDataFrame(df)
 
+    # 创建收敛曲线图，计算完成后显示
+    convergence_chart = ConvergenceChart()
+
     dlg_modal = ft.AlertDialog(
         modal=True,
         title=ft.Text("请选择"),
@@ -215,6 +261,7 @@ def main(page: ft.Page):
                 [
                     status_card,
                     data_frame,
+                    convergence_chart,
                     ft.Row(
                         [get_data_button, start_calculation_button],
                         alignment=ft.MainAxisAlignment.CENTER,
@@ -235,11 +282,12 @@ def main(page: ft.Page):
         try:
             # 调用MidasAPI获取索力数据
             data = MidasAPI("GET", "/db/PTNS")
-            # 将获取的数据保存为Excel文件
-            Pretension_Loads_json_to_excel(data, "init_tension.xlsx")
+            # 将获取的数据保存为Excel文件，写入完成后再替换，避免其他任务读到不完整的文件
+            with atomic_path("init_tension.xlsx") as tmp:
+                Pretension_Loads_json_to_excel(data, tmp)
 
             # 从Excel文件中读取数据并更新数据框
-            df = pd.read_excel("init_tension.xlsx")
+            df = read_ptns_table("init_tension.xlsx")
 
             # 更新数据框
             data_frame.update_data(df)
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from tools import force_to_newton
+
+
+def compute_envelopes(table_json, force="Force-I", dtype=np.float32):
+    """
+    计算全部施工阶段索力历程中各单元的包络（最小、最大、最终索力及最大索力所在阶段）。
+
+    耗时主要在于解析表格中的字符串，包络本身是向量化的分组运算。将数据行分发到多个进程时，
+    序列化的开销大于解析本身（36万行约1.3 s，而整个计算约0.3 s），因此在当前进程中计算：
+    只从数据行中取出需要的4列，逐列转换类型，施工阶段和步骤编码为整数后再分组。
+
+    :param table_json: api.export_force_history返回的表格JSON数据，需包含Elem、Stage、Step列。
+    :param force: 用于计算包络的列名，默认为"Force-I"。
+    :param dtype: 结果中索力列的类型，默认为float32以减少占用，计算过程均为float64。
+    :return: 按单元号排序的包络DataFrame，索力以N为单位。
+    """
+    data = table_json["TrussForce"]
+    rows = data["DATA"]
+    if not rows:
+        raise ValueError("TrussForce表格中没有数据")
+    index = {header: i for i, header in enumerate(data["HEAD"])}
+
+    def column(name):
+        i = index[name]
+        return [row[i] for row in rows]
+
+    stage, stages = pd.factorize(np.asarray(column("Stage"), dtype=object))
+    step, steps = pd.factorize(np.asarray(column("Step"), dtype=object))
+    df = pd.DataFrame(
+        {
+            "Elem": np.asarray(column("Elem"), dtype=np.int64),
+            "Force": force_to_newton(column(force), data.get("FORCE", "N")),
+            "Stage": stage,
+            "Step": step,
+        }
+    )
+    g = df.groupby("Elem", sort=True)
+    # 最大索力所在行和最后一行的行号
+    imax = g["Force"].idxmax().to_numpy()
+    ilast = df.index.to_series().groupby(df["Elem"], sort=True).max().to_numpy()
+    return pd.DataFrame(
+        {
+            "单元号": df["Elem"].to_numpy()[imax],
+            "最小索力": g["Force"].min().to_numpy(dtype=dtype),
+            "最大索力": df["Force"].to_numpy(dtype=dtype)[imax],
+            "最大索力阶段": stages[df["Stage"].to_numpy()[imax]],
+            "最大索力步骤": steps[df["Step"].to_numpy()[imax]],
+            "最终索力": df["Force"].to_numpy(dtype=dtype)[ilast],
+        }
+    )
@@ -0,0 +1,128 @@
+import json
+import os
+import time
+import zipfile
+
+from api import send_midas_request, set_midas_transport
+
+
+def _export_path(body):
+    """
+    返回请求数据中的导出文件路径，没有时返回None。
+    """
+    if isinstance(body, dict) and isinstance(body.get("Argument"), dict):
+        return body["Argument"].get("EXPORT_PATH")
+    return None
+
+
+class MidasRecorder:
+    """
+    录制MidasAPI的通信，包括请求数据、响应数据、导出的表格文件和耗时，保存为zip文件。
+
+    录制期间所有MidasAPI调用都会正常发送到MIDAS，退出with块时保存录制文件。
+
+    示例:
+        with MidasRecorder("session.zip"):
+            compute_tension("tension.json", "target.json")
+    """
+
+    def __init__(self, path, send=send_midas_request):
+        """
+        :param path: 录制文件路径。
+        :param send: 实际发送请求的函数，默认直接发送HTTP请求。
+        """
+        self.path = path
+        self.send = send
+        self.entries = []
+        self.files = {}
+
+    def __call__(self, method, command, body=None):
+        start = time.perf_counter()
+        response = self.send(method, command, body)
+        entry = {
+            "method": method,
+            "command": command,
+            "body": body,
+            "response": response,
+            "elapsed": time.perf_counter() - start,
+        }
+        # 导出文件在读取后会被删除，需在返回前保存
+        export_path = _export_path(body)
+        if export_path and os.path.exists(export_path):
+            member = f"files/{len(self.entries):05d}.json"
+            with open(export_path, "rb") as f:
+                self.files[member] = f.read()
+            entry["file"] = member
+        self.entries.append(entry)
+        return response
+
+    def save(self):
+        """
+        将录制的通信保存为zip文件。
+        """
+        with zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("index.json", json.dumps(self.entries, ensure_ascii=False))
+            for member, data in self.files.items():
+                archive.writestr(member, data)
+
+    def __enter__(self):
+        set_midas_transport(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        set_midas_transport(None)
+        self.save()
+
+
+class MidasReplayer:
+    """
+    按录制顺序回放MidasAPI的通信，不需要MIDAS即可复现compute_tension等函数的计算过程，
+    用于在Linux等环境中分析解析、求解和文件读写的耗时。
+
+    请求的方法和命令路径必须与录制时一致；请求中包含导出路径时，将录制的表格文件写入该路径。
+
+    示例:
+        with MidasReplayer("session.zip", realtime=True):
+            compute_tension("tension.json", "target.json")
+    """
+
+    def __init__(self, path, realtime=False):
+        """
+        :param path: MidasRecorder保存的录制文件路径。
+        :param realtime: 是否按录制时的耗时等待后再返回响应。
+        """
+        self.realtime = realtime
+        self.position = 0
+        with zipfile.ZipFile(path, "r") as archive:
+            self.entries = json.loads(archive.read("index.json").decode("utf-8"))
+            self.files = {
+                entry["file"]: archive.read(entry["file"])
+                for entry in self.entries
+                if "file" in entry
+            }
+
+    def __call__(self, method, command, body=None):
+        if self.position >= len(self.entries):
+            raise RuntimeError(f"录制的通信已全部回放，无法响应{method} {command}")
+        entry = self.entries[self.position]
+        if (entry["method"], entry["command"]) != (method, command):
+            raise RuntimeError(
+                f"第{self.position + 1}个请求与录制不一致："
+                f"录制为{entry['method']} {entry['command']}，实际为{method} {command}"
+            )
+        self.position += 1
+        if self.realtime:
+            time.sleep(entry["elapsed"])
+        export_path = _export_path(body)
+        if "file" in entry and export_path:
+            with open(export_path, "wb") as f:
+                f.write(self.files[entry["file"]])
+        print(method, command, "replay")
+        return entry["response"]
+
+    def __enter__(self):
+        set_midas_transport(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        set_midas_transport(None)
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+
+def per_cable(value, elements, default):
+    """
+    将标量、字典{单元号: 值}或None转换为与elements对应的数组。
+    :param value: 标量时所有索取相同的值；字典中没有的索取default；None时全部取default。
+    :param elements: 单元号列表。
+    :param default: 默认值。
+    """
+    if value is None:
+        return np.full(len(elements), default, dtype=float)
+    if isinstance(value, dict):
+        value = {int(ele): v for ele, v in value.items()}
+        return np.array([value.get(int(ele), default) for ele in elements], dtype=float)
+    return np.full(len(elements), value, dtype=float)
+
+
+def symmetry_groups(group_names, symmetric=True):
+    """
+    由组名称生成对称组的关联矩阵，同一组名称的索施工索力相等。
+    :param group_names: 各索的组名称。
+    :param symmetric: 为False时每根索单独成组。
+    :return: (组名称列表, 关联矩阵G)，G为 索数 × 组数 的0/1矩阵，施工索力 = G × 组施工索力。
+    """
+    if symmetric:
+        codes, labels = pd.factorize(pd.Series(group_names).astype(str))
+        labels = list(labels)
+    else:
+        codes = np.arange(len(group_names))
+        labels = [str(name) for name in group_names]
+    G = np.zeros((len(codes), len(labels)))
+    G[np.arange(len(codes)), codes] = 1.0
+    return labels, G
+
+
+def group_bounds(G, lower, upper):
+    """
+    由各索的上下限得到各组施工索力的上下限（组内取最严格的限值）。
+    :raise ValueError: 某组的下限大于上限时。
+    """
+    lb = np.array([lower[G[:, k] > 0].max() for k in range(G.shape[1])])
+    ub = np.array([upper[G[:, k] > 0].min() for k in range(G.shape[1])])
+    if (lb > ub).any():
+        raise ValueError(f"第{np.flatnonzero(lb > ub).tolist()}组的索力下限大于上限")
+    return lb, ub
+
+
+def bounded_lstsq(A, b, lb, ub, max_iter=None):
+    """
+    求解有界最小二乘问题 min ||A x - b||²，lb ≤ x ≤ ub。
+
+    采用有效集法：有效集中的变量固定在边界上，其余变量做无约束最小二乘；
+    若解越界，则沿该方向前进到第一个边界并将其加入有效集；
+    若解可行，则释放一个梯度指向可行域内的有效变量，直到满足最优性条件。
+
+    :return: 最优解x。
+    """
+    n = A.shape[1]
+    x = np.clip(np.linalg.lstsq(A, b, rcond=None)[0], lb, ub)
+    # 判断是否位于边界的容差，无界变量按其当前值的量级取
+    span = np.where(np.isfinite(ub - lb), np.abs(ub - lb), np.abs(x))
+    tol = 1e-10 * np.maximum(1.0, span)
+    active = (x <= lb + tol) | (x >= ub - tol)
+    # 上下限相等的变量固定在边界上，不会离开有效集
+    fixed = ub - lb <= tol
+    for _ in range(max_iter or 10 * n + 10):
+        free = ~active
+        z = x.copy()
+        if free.any():
+            z[free] = np.linalg.lstsq(
+                A[:, free], b - A[:, active] @ x[active], rcond=None
+            )[0]
+        if ((z >= lb - tol) & (z <= ub + tol)).all():
+            x = np.clip(z, lb, ub)
+            # 检查有效集中的变量是否需要离开边界
+            g = A.T @ (A @ x - b)
+            release = (
+                active
+                & ~fixed
+                & (((x <= lb + tol) & (g < 0)) | ((x >= ub - tol) & (g > 0)))
+            )
+            if not release.any():
+                break
+            active[np.argmax(np.where(release, np.abs(g), -1.0))] = False
+            continue
+        # 沿z - x方向前进到第一个边界，并将到达边界的变量加入有效集
+        d = z - x
+        with np.errstate(divide="ignore", invalid="ignore"):
+            steps = np.where(
+                d > tol, (ub - x) / d, np.where(d < -tol, (lb - x) / d, np.inf)
+            )
+        alpha = max(0.0, steps.min())
+        x = np.clip(x + alpha * d, lb, ub)
+        active |= (x <= lb + tol) | (x >= ub - tol)
+    return x
+
+
+def solve_constrained_tension(response, force, x, target, lb, ub, weights):
+    """
+    在线性化索力响应下求解满足约束的组施工索力。
+
+    索力线性化为 f(x') ≈ force + response × (x' - x)，求解
+    min Σ weights × (f(x') - target)²，lb ≤ x' ≤ ub。
+
+    :param response: 索力对组施工索力的响应矩阵，索数 × 组数。
+    :param force: 当前组施工索力x下的索力。
+    :param x: 当前组施工索力。
+    :param target: 目标索力。
+    :param lb: 组施工索力下限。
+    :param ub: 组施工索力上限。
+    :param weights: 各索的权重。
+    :return: 新的组施工索力。
+    """
+    w = np.sqrt(weights)
+    A = w[:, None] * response
+    b = w * (target - force + response @ x)
+    return bounded_lstsq(A, b, lb, ub)
@@ -0,0 +1,63 @@
+import numpy as np
+
+from solver import bounded_lstsq
+
+
+def random_problem(rng, m, n):
+    """
+    生成随机的有界最小二乘问题，包含无界、单侧有界、上下限相等的变量。
+    """
+    A = rng.standard_normal((m, n))
+    b = rng.standard_normal(m) * 3
+    lb = rng.uniform(-1.0, 0.0, n)
+    ub = lb + rng.uniform(0.0, 1.5, n)
+    kind = rng.integers(0, 4, n)
+    lb[kind == 0] = -np.inf
+    ub[kind == 1] = np.inf
+    ub[kind == 2] = lb[kind == 2]  # 上下限相等，变量固定
+    return A, b, lb, ub
+
+
+def check_kkt(A, b, lb, ub, x, tol=1e-7):
+    """
+    检查可行性和最优性条件：自由变量梯度为零，位于下限的梯度不小于零，位于上限的梯度不大于零。
+    """
+    assert np.all(x >= lb - tol) and np.all(x <= ub + tol)
+    g = A.T @ (A @ x - b)
+    scale = tol * max(1.0, np.abs(A.T @ b).max())
+    at_lb = x <= lb + tol
+    at_ub = x >= ub - tol
+    free = ~at_lb & ~at_ub
+    assert np.all(np.abs(g[free]) <= scale)
+    assert np.all(g[at_lb & ~at_ub] >= -scale)
+    assert np.all(g[at_ub & ~at_lb] <= scale)
+
+
+def test_bounded_lstsq_kkt():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        m = int(rng.integers(3, 30))
+        n = int(rng.integers(1, m + 1))
+        A, b, lb, ub = random_problem(rng, m, n)
+        check_kkt(A, b, lb, ub, bounded_lstsq(A, b, lb, ub))
+
+
+def test_bounded_lstsq_unconstrained():
+    # 约束不起作用时与无约束最小二乘的解一致
+    rng = np.random.default_rng(1)
+    A = rng.standard_normal((20, 6))
+    b = rng.standard_normal(20)
+    x = bounded_lstsq(A, b, np.full(6, -np.inf), np.full(6, np.inf))
+    np.testing.assert_allclose(x, np.linalg.lstsq(A, b, rcond=None)[0], atol=1e-10)
+
+
+def test_bounded_lstsq_fixed_variables():
+    # 上下限相等的变量保持在该值
+    rng = np.random.default_rng(2)
+    A = rng.standard_normal((10, 4))
+    b = rng.standard_normal(10) * 10
+    lb = np.array([-np.inf, 0.5, -1.0, -np.inf])
+    ub = np.array([np.inf, 0.5, 1.0, np.inf])
+    x = bounded_lstsq(A, b, lb, ub)
+    assert x[1] == 0.5
+    check_kkt(A, b, lb, ub, x)
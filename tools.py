@@ -1,83 +1,226 @@
 import json
+import numpy as np
 import pandas as pd
-import winreg
 from typing import Optional, Callable
 import flet as ft
 
+try:
+    import winreg
+except ImportError:
+    # 非Windows系统无法读取MIDAS连接信息，只能使用回放（见replay.py）
+    winreg = None
 
-def Pretension_Loads_json_to_excel(data, excel_file_path):
+
+# 力单位换算为N的系数，程序内部的力统一以N为单位、float64类型计算
+FORCE_UNITS = {
+    "N": 1.0,
+    "kN": 1e3,
+    "MN": 1e6,
+    "kgf": 9.80665,
+    "tonf": 9806.65,
+}
+
+
+def force_to_newton(values, unit="N"):
     """
-    将MIDAS Civil的预张力荷载JSON数据转换为Excel文件
+    将力转换为以N为单位的float64数组
 
     参数:
-        data (dict): 从MIDAS API获取的预张力荷载JSON数据
-        excel_file_path (str): 要保存的Excel文件路径
+        values: 力的数值，可以是列表、数组或Series，元素可以是数字字符串
+        unit (str): values的单位，见FORCE_UNITS
 
     返回:
-        None
+        np.ndarray: 以N为单位的float64数组，单位为N时不做额外的乘法
+    """
+    try:
+        factor = FORCE_UNITS[unit]
+    except KeyError:
+        raise ValueError(f"未知的力单位：{unit}") from None
+    values = np.asarray(values, dtype=np.float64)
+    return values if factor == 1.0 else values * factor
+
+
+# 预张力荷载表格的列名、对应的JSON字段及类型，张力以N为单位
+PTNS_COLUMNS = {
+    "单元号": (None, np.int64),
+    "ID": ("ID", np.int64),
+    "荷载工况名称": ("LCNAME", object),
+    "组名称": ("GROUP_NAME", object),
+    "张力": ("TENSION", np.float64),
+}
+
+
+def ptns_json_to_table(data):
+    """
+    将MIDAS Civil的预张力荷载JSON数据转换为类型明确的Pandas DataFrame
+
+    参数:
+        data (dict): 预张力荷载JSON数据，顶层键为"PTNS"（GET /db/PTNS的返回）
+            或"Assign"（PUT /db/PTNS的请求体）
+
+    返回:
+        pd.DataFrame: 每个荷载项一行，单元包含多个ITEMS时对应多行。单元号、ID为整数，
+            张力为浮点数，荷载工况名称、组名称为字符串
 
     处理过程:
-        1. 解析JSON数据结构，提取每个单元的预张力信息
-        2. 将数据整理为表格形式
-        3. 使用Pandas创建DataFrame
-        4. 将DataFrame保存为Excel文件
+        1. 一次遍历展开所有单元的ITEMS，得到单元号和荷载项列表
+        2. 按列提取各字段，每列只做一次类型转换
     """
+    ptns = data["Assign"] if "Assign" in data else data["PTNS"]
+    keys = [key for key, value in ptns.items() for _ in value["ITEMS"]]
+    items = [item for value in ptns.values() for item in value["ITEMS"]]
+    columns = {}
+    for col, (field, dtype) in PTNS_COLUMNS.items():
+        values = keys if field is None else [item[field] for item in items]
+        columns[col] = np.asarray(values, dtype=dtype)
+    return pd.DataFrame(columns)
 
-    rows = []
-    for key, value in data["PTNS"].items():
-        item = value["ITEMS"][0]
-        row = {
-            "单元号": key,
-            "ID": item["ID"],
-            "荷载工况名称": item["LCNAME"],
-            "组名称": item["GROUP_NAME"],
-            "张力": item["TENSION"],
-        }
-        rows.append(row)
 
-    # 创建 DataFrame
-    df = pd.DataFrame(rows)
+def ptns_table_to_json(df):
+    """
+    将预张力荷载DataFrame转换为MIDAS Civil所需的JSON格式
 
-    # 保存为 Excel 文件
-    df.to_excel(excel_file_path, index=False)
+    参数:
+        df (pd.DataFrame): 包含PTNS_COLUMNS中各列的DataFrame，同一单元号的多行
+            按出现顺序合并为该单元的多个ITEMS
 
+    返回:
+        dict: 符合MIDAS Civil API要求的JSON数据结构{"Assign": {...}}
+    """
+    ptns_dict = {}
+    for key, id_, lcname, group_name, tension in zip(
+        df["单元号"].astype(str).tolist(),
+        df["ID"].tolist(),
+        df["荷载工况名称"].tolist(),
+        df["组名称"].tolist(),
+        df["张力"].tolist(),
+    ):
+        ptns_dict.setdefault(key, {"ITEMS": []})["ITEMS"].append(
+            {
+                "ID": id_,
+                "LCNAME": lcname,
+                "GROUP_NAME": group_name,
+                "TENSION": tension,
+            }
+        )
+    return {"Assign": ptns_dict}
 
-def Pretension_Loads_json_to_df(data):
+
+def ptns_cable_rows(df, eles=None, lcname=None):
     """
-    将MIDAS Civil的预张力荷载JSON数据转换为Pandas DataFrame
+    选出每个单元参与索力迭代的荷载项，单元包含多个ITEMS时其余荷载项保持不变
 
     参数:
-        data (dict): 从MIDAS API获取的预张力荷载JSON数据
+        df (pd.DataFrame): ptns_json_to_table得到的预张力荷载DataFrame
+        eles (list, 可选): 单元号列表，为None时按单元在表格中首次出现的顺序
+        lcname (str, 可选): 荷载工况名称，为None时取各单元的第一个荷载项
 
     返回:
-        pd.DataFrame: 包含预张力信息的DataFrame
+        np.ndarray: 与eles顺序一致的行位置，用于df.iloc
 
-    处理过程:
-        1. 解析JSON数据结构，提取每个单元的预张力信息
-        2. 将数据整理为表格形式
-        3. 使用Pandas创建并返回DataFrame
+    异常:
+        ValueError: 某些单元没有符合条件的荷载项时
     """
+    positions = np.arange(len(df))
+    if lcname is not None:
+        positions = positions[df["荷载工况名称"].to_numpy() == lcname]
+    # 各单元第一个符合条件的荷载项
+    first = pd.Series(positions, index=df["单元号"].to_numpy()[positions])
+    first = first[~first.index.duplicated()]
+    if eles is None:
+        return first.to_numpy()
+    missing = [ele for ele in eles if ele not in first.index]
+    if missing:
+        condition = "" if lcname is None else f"荷载工况为{lcname}的"
+        raise ValueError(f"单元{missing}没有{condition}预张力荷载")
+    return first.loc[eles].to_numpy()
+
+
+# 缺少Parquet读写引擎时的提示
+PARQUET_ENGINE_MESSAGE = (
+    "读写Parquet文件需要安装pyarrow（pip install pyarrow）或fastparquet"
+)
+
+
+def read_ptns_table(file_path):
+    """
+    从Excel（.xlsx/.xls）、CSV（.csv）或Parquet（.parquet）文件读取预张力荷载表格
 
-    rows = []
-    for key, value in data["Assign"].items():
-        item = value["ITEMS"][0]
-        row = {
-            "单元号": key,
-            "ID": item["ID"],
-            "荷载工况名称": item["LCNAME"],
-            "组名称": item["GROUP_NAME"],
-            "张力": item["TENSION"],
-        }
-        rows.append(row)
+    参数:
+        file_path (str): 文件路径，根据扩展名选择读取方式
 
-    # 创建 DataFrame
-    df = pd.DataFrame(rows)
+    返回:
+        pd.DataFrame: 与ptns_json_to_table结果类型一致的DataFrame
+    """
+    dtype = {col: dtype for col, (_, dtype) in PTNS_COLUMNS.items()}
+    dtype["荷载工况名称"] = dtype["组名称"] = str
+    ext = file_path.rsplit(".", 1)[-1].lower()
+    if ext in ("xlsx", "xls"):
+        df = pd.read_excel(file_path, dtype=dtype)
+    elif ext == "csv":
+        df = pd.read_csv(file_path, dtype=dtype, encoding="utf-8-sig")
+    elif ext == "parquet":
+        try:
+            df = pd.read_parquet(file_path).astype(dtype)
+        except ImportError:
+            raise ImportError(PARQUET_ENGINE_MESSAGE) from None
+    else:
+        raise ValueError(f"不支持的文件格式：{file_path}")
     return df
 
 
+def write_ptns_table(df, file_path):
+    """
+    将预张力荷载表格保存为Excel（.xlsx）、CSV（.csv）或Parquet（.parquet）文件
+
+    参数:
+        df (pd.DataFrame): 预张力荷载DataFrame
+        file_path (str): 文件路径，根据扩展名选择保存方式
+    """
+    ext = file_path.rsplit(".", 1)[-1].lower()
+    if ext == "xlsx":
+        df.to_excel(file_path, index=False)
+    elif ext == "csv":
+        df.to_csv(file_path, index=False, encoding="utf-8-sig")
+    elif ext == "parquet":
+        try:
+            df.to_parquet(file_path, index=False)
+        except ImportError:
+            raise ImportError(PARQUET_ENGINE_MESSAGE) from None
+    else:
+        raise ValueError(f"不支持的文件格式：{file_path}")
+
+
+def Pretension_Loads_json_to_excel(data, excel_file_path):
+    """
+    将MIDAS Civil的预张力荷载JSON数据转换为Excel文件
+
+    参数:
+        data (dict): 从MIDAS API获取的预张力荷载JSON数据
+        excel_file_path (str): 要保存的文件路径，也可以是.csv或.parquet文件
+
+    返回:
+        None
+    """
+    write_ptns_table(ptns_json_to_table(data), excel_file_path)
+
+
+def Pretension_Loads_json_to_df(data):
+    """
+    将MIDAS Civil的预张力荷载JSON数据转换为Pandas DataFrame，见ptns_json_to_table
+
+    参数:
+        data (dict): 从MIDAS API获取的预张力荷载JSON数据
+
+    返回:
+        pd.DataFrame: 包含预张力信息的DataFrame
+    """
+    return ptns_json_to_table(data)
+
+
 def Pretension_Loads_df_to_json(df):
     """
-    将包含预张力信息的Pandas DataFrame转换为MIDAS Civil所需的JSON格式
+    将包含预张力信息的Pandas DataFrame转换为MIDAS Civil所需的JSON格式，见ptns_table_to_json
 
     参数:
         df (pd.DataFrame): 包含预张力信息的DataFrame，必须包含以下列：
@@ -89,32 +232,17 @@ def Pretension_Loads_df_to_json(df):
 
     返回:
         dict: 符合MIDAS Civil API要求的JSON数据结构
-
-    处理过程:
-        1. 将DataFrame转换为字典列表
-        2. 按照MIDAS Civil API要求的格式重新构建JSON结构
-        3. 返回最终的JSON数据
     """
-    # 将 DataFrame 转换为字典列表
-    data_list = df.to_dict(orient="records")
-    # 重新构建 JSON 数据结构
-    ptns_dict = {}
-    for item in data_list:
-        key = item["单元号"]
-        sub_dict = {
-            "ITEMS": [
-                {
-                    "ID": item["ID"],
-                    "LCNAME": item["荷载工况名称"],
-                    "GROUP_NAME": item["组名称"],
-                    "TENSION": item["张力"],
-                }
-            ]
-        }
-        ptns_dict[key] = sub_dict
+    return ptns_table_to_json(df)
+
 
-    final_json = {"Assign": ptns_dict}
-    return final_json
+# TrussForce表格中数值列的类型，其余列保持为字符串
+TRUSS_FORCE_DTYPES = {
+    "Index": np.int64,
+    "Elem": np.int64,
+    "Force-I": np.float64,
+    "Force-J": np.float64,
+}
 
 
 def truss_force_tablejson_to_table(json_data):
@@ -135,14 +263,29 @@ def truss_force_tablejson_to_table(json_data):
             }
 
     返回:
-        pd.DataFrame: 转换后的DataFrame，列名为HEAD中的值，数据为DATA中的值
+        pd.DataFrame: 转换后的DataFrame，列名为HEAD中的值。Index、Elem列为整数，
+            Force-I、Force-J列按表格的"FORCE"单位换算为以N为单位的float64，
+            其余列为字符串。df.attrs["FORCE"]记录力的单位"N"
     """
     # 从传入的JSON数据中提取"TrussForce"键对应的值
     data = json_data["TrussForce"]
     # 提取"HEAD"键对应的值，作为DataFrame的列名
     headers = data["HEAD"]
-    # 使用"DATA"键对应的值创建DataFrame，列名为headers
-    df = pd.DataFrame(data["DATA"], columns=headers)
+    # 表格中力的单位，没有时按N处理
+    unit = data.get("FORCE", "N")
+    # 将按行存储的DATA转置为按列存储，每列只做一次类型转换
+    columns = list(zip(*data["DATA"])) or [()] * len(headers)
+    df = pd.DataFrame(
+        {
+            header: (
+                force_to_newton(column, unit)
+                if TRUSS_FORCE_DTYPES.get(header) is np.float64
+                else np.asarray(column, dtype=TRUSS_FORCE_DTYPES.get(header, object))
+            )
+            for header, column in zip(headers, columns)
+        }
+    )
+    df.attrs["FORCE"] = "N"
     # 返回转换后的DataFrame
     return df
 
@@ -152,7 +295,8 @@ def Pretension_Loads_excel_to_json(excel_file_path, json_file_path):
     将包含预张力信息的Excel文件转换为MIDAS Civil所需的JSON格式，并保存为JSON文件。
 
     参数:
-        excel_file_path (str): 包含预张力信息的Excel文件路径。Excel文件必须包含以下列：
+        excel_file_path (str): 包含预张力信息的文件路径，也可以是.csv或.parquet文件。
+            文件必须包含以下列：
             - 单元号: 单元编号
             - ID: 荷载ID
             - 荷载工况名称: 荷载工况名称
@@ -162,39 +306,11 @@ def Pretension_Loads_excel_to_json(excel_file_path, json_file_path):
 
     返回:
         None
-
-    处理过程:
-        1. 从Excel文件中读取数据并转换为Pandas DataFrame。
-        2. 将DataFrame转换为字典列表。
-        3. 按照MIDAS Civil API要求的格式重新构建JSON结构。
-        4. 将最终的JSON数据写入指定的JSON文件。
     """
-    # 读取 Excel 文件
-    df = pd.read_excel(excel_file_path)
-
-    # 将 DataFrame 转换为字典列表
-    data_list = df.to_dict(orient="records")
-
-    # 重新构建 JSON 数据结构
-    ptns_dict = {}
-    for item in data_list:
-        key = item["单元号"]
-        sub_dict = {
-            "ITEMS": [
-                {
-                    "ID": item["ID"],
-                    "LCNAME": item["荷载工况名称"],
-                    "GROUP_NAME": item["组名称"],
-                    "TENSION": item["张力"],
-                }
-            ]
-        }
-        ptns_dict[key] = sub_dict
-
-    final_json = {"Assign": ptns_dict}
+    final_json = ptns_table_to_json(read_ptns_table(excel_file_path))
 
     # 将数据写入 JSON 文件
-    with open(json_file_path, "w", encoding="utf - 8") as f:
+    with open(json_file_path, "w", encoding="utf-8") as f:
         json.dump(final_json, f, ensure_ascii=False, indent=4)
 
 
@@ -224,7 +340,12 @@ class MidasConfig:
 
         Returns:
             tuple: 包含base_url和api_key的元组。
+
+        Raises:
+            OSError: 非Windows系统，或注册表中没有MIDAS连接信息时。
         """
+        if winreg is None:
+            raise OSError("读取MIDAS连接信息需要Windows注册表")
         # 定义注册表路径
         reg_path = r"SOFTWARE\MIDAS\CVLwNX_CH\CONNECTION"
         # 打开注册表键
@@ -302,50 +423,61 @@ class EditableDataFrame(ft.Card):
         )
         self.color = ft.colors.SURFACE
 
+    def _create_column(self, col):
+        """
+        创建并返回一列的列定义
+        """
+        return ft.DataColumn(
+            ft.Text(
+                str(col), weight=ft.FontWeight.BOLD, width=85
+            ),  # 创建一个 DataColumn，包含一个 Text 控件，显示列名，并设置字体加粗和宽度
+            numeric=pd.api.types.is_numeric_dtype(
+                self.df[col]
+            ),  # 根据列的数据类型设置 numeric 属性
+        )
+
     def _create_columns(self):
         """
         创建并返回表格的列定义
         """
-        columns = []  # 初始化一个空列表，用于存储列定义
-        for col in self.df.columns:  # 遍历 DataFrame 的列名
-            columns.append(
-                ft.DataColumn(
-                    ft.Text(
-                        str(col), weight=ft.FontWeight.BOLD, width=85
-                    ),  # 创建一个 DataColumn，包含一个 Text 控件，显示列名，并设置字体加粗和宽度
-                    numeric=pd.api.types.is_numeric_dtype(
-                        self.df[col]
-                    ),  # 根据列的数据类型设置 numeric 属性
-                )
-            )
-        return columns  # 返回列定义列表
+        return [
+            self._create_column(col) for col in self.df.columns
+        ]  # 遍历 DataFrame 的列名，返回列定义列表
+
+    def _create_cell(self, row_idx, col_idx, value):
+        """
+        创建并返回一个单元格，单元格的 content 为显示值的 TextField 控件
+        """
+        tf = ft.TextField(
+            value=str(value),  # 创建一个 TextField 控件，显示单元格的值
+            border="none",  # 设置边框为无
+            height=50,  # 设置高度
+            read_only=True,  # 设置为只读
+            on_focus=lambda e, r=row_idx, c=col_idx: self._handle_cell_focus(
+                e, r, c
+            ),  # 设置获得焦点时的回调函数
+            on_blur=lambda e, r=row_idx, c=col_idx: self._handle_cell_blur(
+                e, r, c
+            ),  # 设置失去焦点时的回调函数
+            expand=True,
+        )
+        return ft.DataCell(tf)
 
     def _create_rows(self):
         """
         创建并返回表格的行定义
         """
         rows = []  # 初始化一个空列表，用于存储行定义
-        for row_idx, row in self.df.iterrows():  # 遍历 DataFrame 的行
-            cells = []  # 初始化一个空列表，用于存储单元格定义
-            for col_idx, value in enumerate(row):  # 遍历行中的每个值
-                cell = ft.DataCell(
-                    ft.TextField(
-                        value=str(value),  # 创建一个 TextField 控件，显示单元格的值
-                        border="none",  # 设置边框为无
-                        height=50,  # 设置高度
-                        read_only=True,  # 设置为只读
-                        on_focus=lambda e,
-                        r=row_idx,
-                        c=col_idx: self._handle_cell_focus(
-                            e, r, c
-                        ),  # 设置获得焦点时的回调函数
-                        on_blur=lambda e, r=row_idx, c=col_idx: self._handle_cell_blur(
-                            e, r, c
-                        ),  # 设置失去焦点时的回调函数
-                        expand=True,
-                    )
-                )
-                cells.append(cell)  # 将单元格添加到 cells 列表中
+        self.cell_fields = []  # 按行、列记录各单元格的 TextField 控件
+        self.highlighted = set()  # 当前高亮的单元格位置
+        for row_idx, *row in self.df.itertuples(
+            name=None
+        ):  # 遍历 DataFrame 的行，itertuples 保留各列原有类型，与 patch_data 显示一致
+            cells = [
+                self._create_cell(row_idx, col_idx, value)
+                for col_idx, value in enumerate(row)  # 遍历行中的每个值
+            ]
+            self.cell_fields.append([cell.content for cell in cells])
             rows.append(
                 ft.DataRow(cells=cells)
             )  # 将 cells 列表添加到 rows 列表中，创建一个 DataRow
@@ -401,6 +533,135 @@ class EditableDataFrame(ft.Card):
         self.data_table.rows = self._create_rows()  # 重新创建表格行
         self.update()  # 更新控件状态
 
+    def _set_highlight(self, tf, on):
+        """
+        设置或取消单元格的高亮，TextField 只有在 filled 为 True 时才绘制背景色
+        """
+        tf.filled = on
+        tf.bgcolor = ft.colors.AMBER_100 if on else None
+
+    def patch_data(self, new_df: pd.DataFrame, highlight: bool = True):
+        """
+        增量更新显示的数据，只修改值发生变化的单元格，适合计算过程中逐次刷新结果
+
+        new_df 的行数与当前相同、且列为当前列加上新增列时，只更新变化的单元格并为
+        新增列创建单元格；否则退回到 update_data 重建整个表格
+        """
+        old_columns = list(self.df.columns)
+        new_columns = list(new_df.columns)
+        if (
+            len(new_df) != len(self.df)
+            or new_columns[: len(old_columns)] != old_columns
+        ):
+            self.update_data(new_df)  # 行数或已有列不同，重建表格
+            return
+
+        # 取消上一次的高亮
+        for r, c in self.highlighted:
+            self._set_highlight(self.cell_fields[r][c], False)
+        self.highlighted = set()
+
+        # 比较显示的文本，只修改发生变化的单元格
+        self.df = new_df.copy()
+        for c, col in enumerate(old_columns):
+            for r, value in enumerate(self.df[col].tolist()):
+                tf = self.cell_fields[r][c]
+                text = str(value)
+                if tf.value != text:
+                    tf.value = text
+                    if highlight:
+                        self._set_highlight(tf, True)  # 高亮变化的单元格
+                        self.highlighted.add((r, c))
+
+        # 为新增的结果列创建列定义和单元格
+        for c in range(len(old_columns), len(new_columns)):
+            col = new_columns[c]
+            self.data_table.columns.append(self._create_column(col))
+            for r, value in enumerate(self.df[col].tolist()):
+                cell = self._create_cell(r, c, value)
+                self.cell_fields[r].append(cell.content)
+                self.data_table.rows[r].cells.append(cell)
+
+        self.update()  # 只有发生变化的控件属性会发送到客户端
+
+
+# 定义一个名为 ConvergenceChart 的类，继承自 ft.Card，用于显示收敛曲线
+class ConvergenceChart(ft.Card):
+    def __init__(self, height: int = 300):
+        super().__init__()
+        self.history = None  # ConvergenceHistory 对象，载入后才显示
+        self.title = ft.Text("最大偏差百分比", weight=ft.FontWeight.BOLD)
+        self.cable_input = ft.TextField(
+            label="单元号（回车显示该索的收敛曲线）",
+            width=260,
+            on_submit=self._handle_cable_submit,  # 输入单元号后按需读取该索的历史
+        )
+        self.chart = ft.LineChart(
+            data_series=[],
+            height=height,
+            expand=True,
+            left_axis=ft.ChartAxis(labels_size=60),
+            bottom_axis=ft.ChartAxis(
+                title=ft.Text("迭代次数"), labels_interval=1, labels_size=30
+            ),
+            horizontal_grid_lines=ft.ChartGridLines(
+                color=ft.colors.OUTLINE_VARIANT, width=1
+            ),
+        )
+        self.content = ft.Container(
+            content=ft.Column(
+                [
+                    ft.Row(
+                        [self.title, self.cable_input],
+                        alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+                    ),
+                    self.chart,
+                ]
+            ),
+            padding=15,
+        )
+        self.visible = False  # 没有收敛历史时不显示
+
+    def load(self, history):
+        """
+        载入收敛历史并显示最大偏差百分比随迭代次数的变化
+        """
+        self.history = history
+        self._show_series("最大偏差百分比", history.max_deviation_percent())
+
+    def _handle_cable_submit(self, e):
+        """
+        显示输入单元号对应的索的偏差百分比曲线
+        """
+        if self.history is None:
+            return
+        try:
+            ele = int(e.control.value)
+            values = self.history.deviation_percent(ele)
+        except (ValueError, KeyError):
+            # 输入为空或单元号不存在时显示最大偏差百分比
+            self._show_series("最大偏差百分比", self.history.max_deviation_percent())
+            return
+        self._show_series(f"单元{ele}偏差百分比", values)
+
+    def _show_series(self, title, values):
+        """
+        用给定的数据替换图表中的曲线
+        """
+        self.title.value = title
+        self.chart.data_series = [
+            ft.LineChartData(
+                data_points=[
+                    ft.LineChartDataPoint(n + 1, float(value))
+                    for n, value in enumerate(values)
+                ],
+                stroke_width=2,
+                color=ft.colors.PRIMARY,
+            )
+        ]
+        self.visible = True
+        self.update()
+
 
 if __name__ == "__main__":
     json_file_path = "./target.json"
@@ -0,0 +1,161 @@
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+
+try:
+    import msvcrt
+except ImportError:
+    # 非Windows系统使用fcntl
+    msvcrt = None
+    import fcntl
+
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """
+    在目标文件所在目录生成一个临时文件路径，写入成功后原子替换目标文件。
+
+    临时文件以"."开头并保留原扩展名，pandas等按扩展名选择写入方式的函数可以直接使用。
+
+    示例:
+        with atomic_path("迭代01.xlsx") as tmp:
+            df.to_excel(tmp, index=False)
+    """
+    folder, name = os.path.split(path)
+    base, ext = os.path.splitext(name)
+    tmp = os.path.join(folder, f".{base}.{uuid.uuid4().hex}{ext}")
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def write_json_atomic(path, data):
+    """
+    原子地写入JSON文件，其他进程只会读到完整的旧文件或新文件。
+    """
+    with atomic_path(path) as tmp, open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+class FileLock:
+    """
+    基于操作系统文件锁的进程间锁，Windows下使用msvcrt.locking，其他系统使用fcntl.flock。
+
+    锁由打开锁文件的句柄持有，进程退出（包括崩溃或被结束）时由操作系统自动释放，
+    不会因残留的锁文件而一直阻塞。锁文件本身保留，其中记录最近持有锁的进程号。
+
+    示例:
+        with FileLock("model.lock", timeout=60):
+            ...
+    """
+
+    def __init__(self, path, timeout=None, poll_interval=0.5):
+        """
+        :param path: 锁文件路径。
+        :param timeout: 等待锁的最长时间（秒），为None时一直等待。
+        :param poll_interval: 检查锁是否释放的时间间隔（秒）。
+        """
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fd = None
+
+    def try_acquire(self):
+        """
+        尝试获取锁，不等待。
+        :return: 获取成功时返回True，锁被其他任务持有时返回False。
+        """
+        if self._fd is not None:
+            raise RuntimeError(f"已持有锁文件{self.path}")
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR)
+        try:
+            if msvcrt is not None:
+                # 锁定文件的第一个字节
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        os.lseek(fd, 0, os.SEEK_SET)
+        self._fd = fd
+        return True
+
+    def acquire(self):
+        """
+        获取锁，超时时抛出TimeoutError。
+        """
+        start = time.monotonic()
+        while not self.try_acquire():
+            if self.timeout is not None and time.monotonic() - start > self.timeout:
+                raise TimeoutError(
+                    f"等待锁文件{self.path}超时，模型正在被其他计算任务使用"
+                )
+            time.sleep(self.poll_interval)
+
+    def release(self):
+        """
+        释放锁，未持有锁时不做任何操作。
+        """
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            if msvcrt is not None:
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def midas_lock(base_url, timeout=None):
+    """
+    返回与MIDAS API地址对应的进程间锁，同一个MIDAS模型同时只能由一个计算任务驱动，
+    不同地址的模型可以并行计算。
+    :param base_url: MIDAS API的基本URL。
+    :param timeout: 等待锁的最长时间（秒），为None时一直等待。
+    """
+    name = hashlib.md5(str(base_url).encode("utf-8")).hexdigest()[:12]
+    return FileLock(
+        os.path.join(tempfile.gettempdir(), f"CalTensionForce_{name}.lock"), timeout
+    )
+
+
+class RunWorkspace:
+    """
+    单次计算的工作目录，目录名由时间和随机字符组成，多个计算任务互不干扰。
+
+    示例:
+        workspace = RunWorkspace()
+        compute_tension(..., work_dir=workspace.folder, history=workspace.path("history"))
+    """
+
+    def __init__(self, root="runs"):
+        """
+        :param root: 存放各次计算工作目录的父目录。
+        """
+        os.makedirs(root, exist_ok=True)
+        self.folder = tempfile.mkdtemp(prefix=time.strftime("%Y%m%d-%H%M%S-"), dir=root)
+
+    def path(self, name):
+        """
+        返回工作目录中的文件路径。
+        """
+        return os.path.join(self.folder, name)